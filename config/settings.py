@@ -25,15 +25,37 @@ MIN_HEIGHT = 600
 
 # Размеры компонентов
 SIDEBAR_WIDTH = 280
+SIDEBAR_ROW_HEIGHT = 50
 AVATAR_SIZE = 40
 AVATAR_SIZE_SMALL = 30
+AVATAR_HYDRATE_POLL_MS = 50
+PHOTO_PREVIEW_SIZE = (300, 300)
+PHOTO_CACHE_SIZE = 64
 
 # Пути к директориям
 CHARACTERS_DIR = "characters"
 GROUPS_DIR = "groups"
 CHATS_DIR = "chats"
 PROVIDERS_PATH = "config/providers.yml"
+CACHE_DIR = ".cache"
 
 # Настройки истории
 MAX_MESSAGES_IN_HISTORY = 100
 MAX_MESSAGES_FOR_API = 15
+SAVE_DEBOUNCE_INTERVAL = 0.5
+SAVE_MAX_DELAY = 2.0
+MESSAGES_RENDER_WINDOW = 30
+MESSAGES_RENDER_PAGE = 20
+
+# Настройки API
+API_MAX_WORKERS = 8
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RECOVERY_SECONDS = 30
+API_RETRY_ATTEMPTS = 3
+API_RETRY_BASE_DELAY = 0.5
+API_RETRY_MAX_DELAY = 8.0
+# Не больше половины API_MAX_WORKERS: медленный провайдер не занимает весь пул
+PROVIDER_MAX_CONCURRENCY = 4
+# Ожидание свободного слота не дольше таймаута одного HTTP-запроса
+PROVIDER_ACQUIRE_TIMEOUT = 30
+PROVIDERS_CATALOG_TTL = 86400
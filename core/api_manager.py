@@ -3,10 +3,119 @@
 """
 Управление API запросами к различным провайдерам
 """
-import yaml
+import importlib
+import itertools
 import os
+import random
+import re
+import threading
+import time
 import requests
-from typing import Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from core.storage import load_yaml_cached, json_dumps, json_loads
+from config.settings import (API_MAX_WORKERS, BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_SECONDS,
+                             API_RETRY_ATTEMPTS, API_RETRY_BASE_DELAY, API_RETRY_MAX_DELAY,
+                             PROVIDER_MAX_CONCURRENCY, PROVIDER_ACQUIRE_TIMEOUT, PROVIDERS_CATALOG_TTL)
+
+# Префиксы сообщений об ошибках для провайдеров
+_ERROR_PREFIXES = {
+    'claude': 'Ошибка Claude',
+    'gemini': 'Ошибка Gemini',
+    'deepseek': 'Ошибка DeepSeek',
+}
+
+# Маркеры, после которых модель начинает генерировать мусор
+_CUT_TAGS = ["СТОП", "INST", "Human:", "Assistant:", "###"]
+_CUT_TAGS_RE = re.compile('|'.join(re.escape(tag) for tag in _CUT_TAGS))
+_CUT_TAG_MAX_LEN = max(len(tag) for tag in _CUT_TAGS)
+
+@lru_cache(maxsize=None)
+def _import_sdk(module_name: str):
+    """Импортирует SDK провайдера при первом обращении; None, если пакет не установлен."""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+# HTTP-статусы, при которых имеет смысл повторить запрос
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+def _is_retryable(exc: Exception) -> bool:
+    """Определяет, является ли ошибка временной (лимиты, 5xx, сеть)."""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    # anthropic/openai хранят статус в status_code, requests - в response,
+    # google.api_core - в code
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status is None:
+        status = getattr(exc, 'code', None)
+    if isinstance(status, int):
+        return status in _RETRYABLE_STATUSES
+    return type(exc).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+def _retry(fn, max_attempts: int = API_RETRY_ATTEMPTS, base: float = API_RETRY_BASE_DELAY,
+           cap: float = API_RETRY_MAX_DELAY):
+    """Вызывает fn с повторами: экспоненциальная задержка с полным джиттером."""
+    for attempt in range(max_attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_attempts - 1 or not _is_retryable(e):
+                raise
+            time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+
+class _Breaker:
+    """Предохранитель провайдера: CLOSED -> OPEN -> HALF_OPEN -> CLOSED."""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery: float = BREAKER_RECOVERY_SECONDS):
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = 0.0
+        self.threshold = threshold
+        self.recovery = recovery
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Проверяет, можно ли отправить запрос."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.recovery:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                # В полуоткрытом состоянии пропускаем только один пробный запрос
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+    
+    def record_success(self):
+        """Сбрасывает предохранитель после успешного ответа."""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failure_count = 0
+            self._probe_in_flight = False
+    
+    def record_failure(self):
+        """Учитывает ошибку и размыкает цепь при достижении порога."""
+        with self._lock:
+            self.failure_count += 1
+            if self.state == self.HALF_OPEN or self.failure_count >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
 
 class APIManager:
     """Класс для работы с API провайдерами."""
@@ -14,130 +123,408 @@ class APIManager:
     def __init__(self, providers_config_path="config/providers.yml"):
         self.config_path = providers_config_path
         self.config = {}
+        # Каталог для UI: (время сборки, провайдеры, провайдер -> модели)
+        self._catalog: Optional[Tuple[float, List[str], Dict[str, List[str]]]] = None
         self.current_provider = None
         self.current_model = None
+        # Заготовка запроса к OpenAI-совместимым API: (заголовки, неизменная часть тела)
+        self._request_template = ({}, {})
+        self.breakers: Dict[str, _Breaker] = {}
+        # Изоляция провайдеров: ограничение числа одновременных запросов к каждому
+        self._bulkheads: Dict[str, threading.BoundedSemaphore] = {}
+        # Клиенты SDK: (провайдер, ключ, url) -> клиент с собственным пулом соединений
+        self._clients: Dict[Tuple[str, str, str], Any] = {}
+        # Модели Gemini: (ключ, модель) -> GenerativeModel
+        self._gemini_models: Dict[Tuple[str, str], Any] = {}
+        # Таблица отправки: провайдер -> метод
+        self._dispatch = {
+            'claude': self._send_claude,
+            'gemini': self._send_gemini,
+            'openrouter': self._send_openai_compatible,
+            'chutes': self._send_openai_compatible,
+            'featherless': self._send_openai_compatible,
+            'moonshot': self._send_openai_compatible,
+            'deepseek': self._send_deepseek,
+        }
+        self._stream_dispatch = {
+            'claude': self._stream_claude,
+            'gemini': self._stream_gemini,
+            'openrouter': self._stream_openai_compatible,
+            'chutes': self._stream_openai_compatible,
+            'featherless': self._stream_openai_compatible,
+            'moonshot': self._stream_openai_compatible,
+            'deepseek': self._stream_deepseek,
+        }
+        # Общая сессия: keep-alive и пул соединений вместо нового TLS на каждый запрос
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Пул потоков для параллельных запросов (например, к участникам группы)
+        self._executor = ThreadPoolExecutor(max_workers=API_MAX_WORKERS, thread_name_prefix='api')
         self.load_config()
     
+    def close(self):
+        """Закрывает HTTP-сессию, клиентов SDK и пул потоков."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for client in self._clients.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        self._clients.clear()
+        self._gemini_models.clear()
+        self.session.close()
+    
     def load_config(self):
         """Загружает конфигурацию провайдеров."""
         if not os.path.exists(self.config_path):
             print(f"ПРЕДУПРЕЖДЕНИЕ: Файл {self.config_path} не найден!")
             return
-        with open(self.config_path, 'r', encoding='utf-8') as f:
-            self.config = yaml.safe_load(f)
+        # Ключи API не должны попадать в JSON-кэш на диске
+        self.config = load_yaml_cached(self.config_path, json_cache=False)
+        self._catalog = None
+        # Заготовка запроса содержит ключ из конфига - пересобираем ее вместе с конфигом
+        if self.current_provider:
+            self.set_provider_and_model(self.current_provider, self.current_model)
+    
+    def _get_catalog(self) -> Tuple[float, List[str], Dict[str, List[str]]]:
+        """Каталог провайдеров и моделей; конфиг перечитывается не чаще раза в PROVIDERS_CATALOG_TTL."""
+        catalog = self._catalog
+        if catalog is None or time.monotonic() - catalog[0] > PROVIDERS_CATALOG_TTL:
+            if catalog is not None:
+                self.load_config()
+            providers = list(self.config.keys())
+            models = {provider: self.config[provider].get('models', []) for provider in providers}
+            catalog = self._catalog = (time.monotonic(), providers, models)
+        return catalog
     
     def get_providers(self):
         """Возвращает список доступных провайдеров."""
-        return list(self.config.keys())
+        return self._get_catalog()[1]
     
     def get_models(self, provider):
         """Возвращает список моделей для провайдера."""
-        return self.config.get(provider, {}).get('models', [])
+        return self._get_catalog()[2].get(provider, [])
     
     def set_provider_and_model(self, provider, model):
         """Устанавливает текущего провайдера и модель."""
         self.current_provider = provider
         self.current_model = model
+        api_key = self.config.get(provider, {}).get('key', '')
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        self._request_template = (headers, {"model": model})
     
     def send_message(self, prompt: str, temperature: float = 0.7, max_tokens: int = 300) -> str:
         """Отправляет запрос к текущему API."""
         if not self.current_provider or not self.current_model:
             return "Ошибка: Провайдер или модель не выбраны"
         
-        provider_data = self.config.get(self.current_provider, {})
-        api_key = provider_data.get('key', '')
+        provider = self.current_provider
+        provider_data = self.config.get(provider, {})
+        sender = self._dispatch.get(provider)
+        if sender is None:
+            return f"Провайдер {provider} не поддерживается"
         
+        bulkhead = self._get_bulkhead(provider)
+        if not bulkhead.acquire(timeout=PROVIDER_ACQUIRE_TIMEOUT):
+            return f"Провайдер {provider} перегружен, попробуйте позже"
         try:
-            if self.current_provider == 'claude':
-                return self._send_claude(prompt, api_key, temperature, max_tokens)
-            elif self.current_provider == 'gemini':
-                return self._send_gemini(prompt, api_key, temperature, max_tokens)
-            elif self.current_provider in ['openrouter', 'chutes', 'featherless', 'moonshot']:
-                api_url = provider_data.get('api', '')
-                return self._send_openai_compatible(prompt, api_url, api_key, temperature, max_tokens)
-            elif self.current_provider == 'deepseek':
-                api_url = provider_data.get('api', '')
-                return self._send_deepseek(prompt, api_url, api_key, temperature, max_tokens)
-            else:
-                return f"Провайдер {self.current_provider} не поддерживается"
-        except Exception as e:
-            return f"Ошибка API: {str(e)}"
+            return self._send_with_breaker(provider, sender, prompt, provider_data, temperature, max_tokens)
+        finally:
+            bulkhead.release()
     
-    def _send_claude(self, prompt: str, api_key: str, temperature: float, max_tokens: int) -> str:
-        """Отправка к Claude API."""
+    def _get_breaker(self, provider: str) -> _Breaker:
+        """Возвращает предохранитель провайдера."""
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = self.breakers.setdefault(provider, _Breaker())
+        return breaker
+    
+    def _get_bulkhead(self, provider: str) -> threading.BoundedSemaphore:
+        """Возвращает семафор, ограничивающий параллельные запросы к провайдеру."""
+        bulkhead = self._bulkheads.get(provider)
+        if bulkhead is None:
+            bulkhead = self._bulkheads.setdefault(provider, threading.BoundedSemaphore(PROVIDER_MAX_CONCURRENCY))
+        return bulkhead
+    
+    def _send_with_breaker(self, provider: str, sender, prompt: str, provider_data: Dict[str, Any],
+                           temperature: float, max_tokens: int) -> str:
+        """Выполняет запрос через предохранитель провайдера с повторами."""
+        breaker = self._get_breaker(provider)
+        if not breaker.allow():
+            return f"Провайдер {provider} временно недоступен, попробуйте позже"
+        
         try:
-            import anthropic
-            client = anthropic.Anthropic(api_key=api_key, max_retries=0)
-            response = client.messages.create(
-                model=self.current_model,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return self._clean_text(response.content[0].text)
+            response = _retry(lambda: sender(prompt, provider_data, temperature, max_tokens))
         except Exception as e:
-            return f"Ошибка Claude: {str(e)}"
+            breaker.record_failure()
+            return f"{_ERROR_PREFIXES.get(provider, 'Ошибка API')}: {str(e)}"
+        breaker.record_success()
+        return response
     
-    def _send_gemini(self, prompt: str, api_key: str, temperature: float, max_tokens: int) -> str:
-        """Отправка к Gemini API."""
+    def send_message_async(self, prompt: str, temperature: float = 0.7, max_tokens: int = 300) -> Future:
+        """Отправляет запрос в фоновом потоке и возвращает Future с ответом."""
+        return self._executor.submit(self.send_message, prompt, temperature, max_tokens)
+    
+    def stream_message(self, prompt: str, temperature: float = 0.7, max_tokens: int = 300) -> Iterator[str]:
+        """Отправляет запрос к текущему API и отдает ответ по частям по мере генерации."""
+        if not self.current_provider or not self.current_model:
+            yield "Ошибка: Провайдер или модель не выбраны"
+            return
+        
+        provider = self.current_provider
+        provider_data = self.config.get(provider, {})
+        streamer = self._stream_dispatch.get(provider)
+        if streamer is None:
+            yield f"Провайдер {provider} не поддерживается"
+            return
+        
+        bulkhead = self._get_bulkhead(provider)
+        if not bulkhead.acquire(timeout=PROVIDER_ACQUIRE_TIMEOUT):
+            yield f"Провайдер {provider} перегружен, попробуйте позже"
+            return
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(self.current_model)
-            generation_config = {
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-            }
-            response = model.generate_content(prompt, generation_config=generation_config)
-            return self._clean_text(response.text)
+            yield from self._stream_with_breaker(provider, streamer, prompt, provider_data,
+                                                 temperature, max_tokens)
+        finally:
+            bulkhead.release()
+    
+    def _stream_with_breaker(self, provider: str, streamer, prompt: str, provider_data: Dict[str, Any],
+                             temperature: float, max_tokens: int) -> Iterator[str]:
+        """Читает поток ответа через предохранитель провайдера, обрезая по маркерам."""
+        breaker = self._get_breaker(provider)
+        if not breaker.allow():
+            yield f"Провайдер {provider} временно недоступен, попробуйте позже"
+            return
+        
+        try:
+            chunks, first = self._open_stream(streamer, prompt, provider_data, temperature, max_tokens)
         except Exception as e:
-            return f"Ошибка Gemini: {str(e)}"
+            breaker.record_failure()
+            yield f"{_ERROR_PREFIXES.get(provider, 'Ошибка API')}: {str(e)}"
+            return
+        
+        buffer = ''
+        sent = 0
+        failed = False
+        try:
+            for chunk in itertools.chain((first,), chunks):
+                if not chunk:
+                    continue
+                start = max(0, len(buffer) - _CUT_TAG_MAX_LEN)
+                buffer += chunk
+                match = _CUT_TAGS_RE.search(buffer, start)
+                if match:
+                    buffer = buffer[:match.start()]
+                    break
+                # Хвост придерживаем: в нем может начинаться маркер обрезки
+                safe = len(buffer) - _CUT_TAG_MAX_LEN + 1
+                if safe > sent:
+                    yield buffer[sent:safe]
+                    sent = safe
+        except Exception as e:
+            failed = True
+            breaker.record_failure()
+            error = f"{_ERROR_PREFIXES.get(provider, 'Ошибка API')}: {str(e)}"
+            yield f"\n{error}" if sent else error
+            return
+        finally:
+            chunks.close()
+            if not failed:
+                breaker.record_success()
+        
+        if len(buffer) > sent:
+            yield buffer[sent:]
     
-    def _send_openai_compatible(self, prompt: str, api_url: str, api_key: str, 
-                                 temperature: float, max_tokens: int) -> str:
-        """Отправка к OpenAI-совместимым API."""
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
+    @staticmethod
+    def _open_stream(streamer, prompt: str, provider_data: Dict[str, Any],
+                     temperature: float, max_tokens: int) -> Tuple[Iterator[str], str]:
+        """Открывает поток ответа с повторами до первого непустого фрагмента; после него повторов нет."""
+        def attempt():
+            chunks = streamer(prompt, provider_data, temperature, max_tokens)
+            try:
+                for chunk in chunks:
+                    if chunk:
+                        return chunks, chunk
+            except BaseException:
+                chunks.close()
+                raise
+            return chunks, ''
+        
+        return _retry(attempt)
+    
+    def _claude_client(self, anthropic, api_key: str):
+        """Возвращает закэшированный клиент Anthropic."""
+        client_key = ('claude', api_key, '')
+        client = self._clients.get(client_key)
+        if client is None:
+            client = self._clients.setdefault(client_key, anthropic.Anthropic(api_key=api_key, max_retries=0))
+        return client
+    
+    def _gemini_model(self, genai, api_key: str):
+        """Возвращает закэшированную модель Gemini."""
+        model_key = (api_key, self.current_model)
+        model = self._gemini_models.get(model_key)
+        if model is None:
+            genai.configure(api_key=api_key)
+            model = self._gemini_models.setdefault(model_key, genai.GenerativeModel(self.current_model))
+        return model
+    
+    def _deepseek_client(self, openai, api_key: str, api_url: str):
+        """Возвращает закэшированный клиент OpenAI для DeepSeek."""
+        client_key = ('deepseek', api_key, api_url)
+        client = self._clients.get(client_key)
+        if client is None:
+            client = self._clients.setdefault(
+                client_key, openai.OpenAI(api_key=api_key, base_url=api_url, max_retries=0)
+            )
+        return client
+    
+    def _openai_request(self, prompt: str, temperature: float, max_tokens: int, stream: bool):
+        """Дополняет заготовку запроса к OpenAI-совместимому API параметрами вызова."""
+        headers, payload_base = self._request_template
         payload = {
-            "model": self.current_model,
+            **payload_base,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": max_tokens,
             "temperature": temperature,
-            "stream": False
+            "stream": stream
         }
-        try:
-            response = requests.post(api_url, json=payload, headers=headers, timeout=30)
-            response.raise_for_status()
-            api_response = response.json()
-            return self._clean_text(api_response["choices"][0]["message"]["content"])
-        except Exception as e:
-            return f"Ошибка API: {str(e)}"
+        return headers, payload
+    
+    def _send_claude(self, prompt: str, provider_data: Dict[str, Any],
+                     temperature: float, max_tokens: int) -> str:
+        """Отправка к Claude API."""
+        anthropic = _import_sdk('anthropic')
+        if anthropic is None:
+            return "Ошибка Claude: пакет anthropic не установлен"
+        client = self._claude_client(anthropic, provider_data.get('key', ''))
+        response = client.messages.create(
+            model=self.current_model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return self._clean_text(response.content[0].text)
+    
+    def _send_gemini(self, prompt: str, provider_data: Dict[str, Any],
+                     temperature: float, max_tokens: int) -> str:
+        """Отправка к Gemini API."""
+        genai = _import_sdk('google.generativeai')
+        if genai is None:
+            return "Ошибка Gemini: пакет google-generativeai не установлен"
+        model = self._gemini_model(genai, provider_data.get('key', ''))
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
+        response = model.generate_content(prompt, generation_config=generation_config)
+        return self._clean_text(response.text)
     
-    def _send_deepseek(self, prompt: str, api_url: str, api_key: str,
+    def _send_openai_compatible(self, prompt: str, provider_data: Dict[str, Any],
+                                 temperature: float, max_tokens: int) -> str:
+        """Отправка к OpenAI-совместимым API."""
+        headers, payload = self._openai_request(prompt, temperature, max_tokens, False)
+        response = self.session.post(provider_data.get('api', ''), data=json_dumps(payload),
+                                     headers=headers, timeout=30)
+        response.raise_for_status()
+        api_response = json_loads(response.content)
+        return self._clean_text(api_response["choices"][0]["message"]["content"])
+    
+    def _send_deepseek(self, prompt: str, provider_data: Dict[str, Any],
                        temperature: float, max_tokens: int) -> str:
         """Отправка к DeepSeek API."""
-        try:
-            from openai import OpenAI
-            client = OpenAI(api_key=api_key, base_url=api_url)
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                stream=False
-            )
-            return self._clean_text(response.choices[0].message.content)
-        except Exception as e:
-            return f"Ошибка DeepSeek: {str(e)}"
+        openai = _import_sdk('openai')
+        if openai is None:
+            return "Ошибка DeepSeek: пакет openai не установлен"
+        client = self._deepseek_client(openai, provider_data.get('key', ''), provider_data.get('api', ''))
+        response = client.chat.completions.create(
+            model="deepseek-chat",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=False
+        )
+        return self._clean_text(response.choices[0].message.content)
+    
+    def _stream_claude(self, prompt: str, provider_data: Dict[str, Any],
+                       temperature: float, max_tokens: int) -> Iterator[str]:
+        """Потоковая отправка к Claude API."""
+        anthropic = _import_sdk('anthropic')
+        if anthropic is None:
+            yield "Ошибка Claude: пакет anthropic не установлен"
+            return
+        client = self._claude_client(anthropic, provider_data.get('key', ''))
+        with client.messages.stream(
+            model=self.current_model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=[{"role": "user", "content": prompt}]
+        ) as stream:
+            yield from stream.text_stream
+    
+    def _stream_gemini(self, prompt: str, provider_data: Dict[str, Any],
+                       temperature: float, max_tokens: int) -> Iterator[str]:
+        """Потоковая отправка к Gemini API."""
+        genai = _import_sdk('google.generativeai')
+        if genai is None:
+            yield "Ошибка Gemini: пакет google-generativeai не установлен"
+            return
+        model = self._gemini_model(genai, provider_data.get('key', ''))
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
+        for chunk in model.generate_content(prompt, generation_config=generation_config, stream=True):
+            yield chunk.text
+    
+    def _stream_openai_compatible(self, prompt: str, provider_data: Dict[str, Any],
+                                  temperature: float, max_tokens: int) -> Iterator[str]:
+        """Потоковая отправка к OpenAI-совместимым API (Server-Sent Events)."""
+        headers, payload = self._openai_request(prompt, temperature, max_tokens, True)
+        with self.session.post(provider_data.get('api', ''), data=json_dumps(payload), headers=headers,
+                               timeout=30, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith(b'data: '):
+                    continue
+                data = line[6:]
+                if data == b'[DONE]':
+                    break
+                choices = json_loads(data).get('choices')
+                if choices:
+                    content = choices[0].get('delta', {}).get('content')
+                    if content:
+                        yield content
+    
+    def _stream_deepseek(self, prompt: str, provider_data: Dict[str, Any],
+                         temperature: float, max_tokens: int) -> Iterator[str]:
+        """Потоковая отправка к DeepSeek API."""
+        openai = _import_sdk('openai')
+        if openai is None:
+            yield "Ошибка DeepSeek: пакет openai не установлен"
+            return
+        client = self._deepseek_client(openai, provider_data.get('key', ''), provider_data.get('api', ''))
+        response = client.chat.completions.create(
+            model="deepseek-chat",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     
     def _clean_text(self, text: str) -> str:
         """Очищает текст от артефактов."""
         if not text:
             return "Ответ пустой"
-        cut_tags = ["СТОП", "INST", "Human:", "Assistant:", "###"]
-        for tag in cut_tags:
-            if tag in text:
-                text = text.split(tag)[0]
-        return text.strip() if text.strip() else "Ответ пустой"
+        match = _CUT_TAGS_RE.search(text)
+        if match:
+            text = text[:match.start()]
+        return text.strip() or "Ответ пустой"
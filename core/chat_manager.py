@@ -3,15 +3,26 @@
 """
 Управление чатами и историей сообщений
 """
-import json
+import itertools
 import os
-import yaml
+import queue
+import threading
+import time
+from collections import deque
+from itertools import islice
+from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Deque, Dict, List, Optional, Tuple
 from models.character import Character
 from models.group import Group
 from models.message import Message
-from config.settings import CHARACTERS_DIR, GROUPS_DIR, CHATS_DIR, MAX_MESSAGES_IN_HISTORY, MAX_MESSAGES_FOR_API
+from core.storage import load_yaml_cached, dump_yaml, json_dumps, json_loads
+from config.settings import (CHARACTERS_DIR, GROUPS_DIR, CHATS_DIR, MAX_MESSAGES_IN_HISTORY,
+                             MAX_MESSAGES_FOR_API, SAVE_DEBOUNCE_INTERVAL,
+                             SAVE_MAX_DELAY)
+
+# Счетчик делает id уникальными даже для сообщений и групп, созданных в один момент
+_ID_COUNTER = itertools.count()
 
 class ChatManager:
     """Класс для управления чатами."""
@@ -19,9 +30,30 @@ class ChatManager:
     def __init__(self):
         self.characters: Dict[str, Character] = {}
         self.groups: Dict[str, Group] = {}
-        self.chats: Dict[str, List[Message]] = {}
+        # История загружается при первом обращении; None - чат еще не прочитан с диска.
+        # deque(maxlen) сам отбрасывает сообщения старше MAX_MESSAGES_IN_HISTORY
+        self.chats: Dict[str, Optional[Deque[Message]]] = {}
+        # Число строк в JSONL-журнале каждого чата (для компактизации)
+        self._line_counts: Dict[str, int] = {}
+        # Кэши для сборки промптов: id отправителя -> имя, ключ чата -> системный промпт
+        self._name_cache: Dict[str, str] = {}
+        self._sys_prompt_cache: Dict[Tuple, str] = {}
+        # Уже отформатированные строки истории для промпта: чат -> [(сообщение, строка)]
+        self._history_lines: Dict[str, Deque[Tuple[Message, str]]] = {}
+        self._history_lock = threading.Lock()
+        # Упорядоченный список (id, имя, тип) для боковой панели; None - нужно пересобрать
+        self._chat_view: Optional[List[Tuple[str, str, str]]] = None
         self._ensure_directories()
         self.load_all_data()
+        # Запись истории на диск идет в отдельном потоке, чтобы не блокировать UI
+        self._save_queue: "queue.Queue[Optional[Tuple[str, Message]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name='chat-writer', daemon=True)
+        self._writer.start()
+    
+    def close(self):
+        """Дописывает накопленные сообщения на диск и останавливает поток записи."""
+        self._save_queue.put(None)
+        self._writer.join()
     
     def _ensure_directories(self):
         """Создает необходимые директории."""
@@ -33,162 +65,314 @@ class ChatManager:
         self._load_characters()
         self._load_groups()
         self._load_chats()
+        self._chat_view = None
+    
+    @property
+    def ordered_chat_view(self) -> List[Tuple[str, str, str]]:
+        """Чаты в порядке отображения: сначала личные, затем групповые."""
+        if self._chat_view is None:
+            view = [(char_id, char.name, 'private') for char_id, char in self.characters.items()]
+            view.extend((group_id, group.name, 'group') for group_id, group in self.groups.items())
+            self._chat_view = view
+        return self._chat_view
+    
+    @staticmethod
+    def _scan_dir(path: str) -> List[os.DirEntry]:
+        """Содержимое каталога; тип записи DirEntry берет из самого чтения каталога."""
+        try:
+            with os.scandir(path) as it:
+                return list(it)
+        except FileNotFoundError:
+            return []
     
     def _load_characters(self):
         """Загружает персонажей из файлов."""
-        if not os.path.exists(CHARACTERS_DIR):
-            return
-        for char_folder in os.listdir(CHARACTERS_DIR):
-            char_path = os.path.join(CHARACTERS_DIR, char_folder)
-            if not os.path.isdir(char_path):
+        for entry in self._scan_dir(CHARACTERS_DIR):
+            if not entry.is_dir():
+                continue
+            config_path = os.path.join(entry.path, "character.yml")
+            try:
+                data = load_yaml_cached(config_path)
+            except FileNotFoundError:
                 continue
-            config_path = os.path.join(char_path, "character.yml")
-            if os.path.exists(config_path):
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    data = yaml.safe_load(f)
-                    char = Character(
-                        char_id=data['id'],
-                        name=data['name'],
-                        private_prompt=data.get('private_prompt', ''),
-                        group_prompt=data.get('group_prompt', ''),
-                        photos=data.get('photos', [])
-                    )
-                    self.characters[char.char_id] = char
+            char = Character(
+                char_id=data['id'],
+                name=data['name'],
+                private_prompt=data.get('private_prompt', ''),
+                group_prompt=data.get('group_prompt', ''),
+                photos=data.get('photos', [])
+            )
+            self.characters[char.char_id] = char
     
     def _load_groups(self):
         """Загружает группы из файлов."""
-        if not os.path.exists(GROUPS_DIR):
-            return
-        for group_file in os.listdir(GROUPS_DIR):
-            if group_file.endswith('.yml'):
-                with open(os.path.join(GROUPS_DIR, group_file), 'r', encoding='utf-8') as f:
-                    data = yaml.safe_load(f)
-                    group = Group(
-                        group_id=data['id'],
-                        name=data['name'],
-                        members=data.get('members', []),
-                        group_context=data.get('group_context', '')
-                    )
-                    self.groups[group.group_id] = group
+        for entry in self._scan_dir(GROUPS_DIR):
+            if entry.name.endswith('.yml') and entry.is_file():
+                data = load_yaml_cached(entry.path)
+                group = Group(
+                    group_id=data['id'],
+                    name=data['name'],
+                    members=data.get('members', []),
+                    group_context=data.get('group_context', '')
+                )
+                self.groups[group.group_id] = group
     
     def _load_chats(self):
-        """Загружает историю чатов."""
-        if not os.path.exists(CHATS_DIR):
-            return
-        for chat_file in os.listdir(CHATS_DIR):
-            if chat_file.endswith('.json'):
-                chat_id = chat_file.replace('.json', '')
-                messages = self._load_chat_history(chat_id)
-                self.chats[chat_id] = messages
+        """Индексирует чаты на диске, не читая историю."""
+        for entry in self._scan_dir(CHATS_DIR):
+            chat_id, ext = os.path.splitext(entry.name)
+            if ext in ('.jsonl', '.json'):
+                self.chats.setdefault(chat_id, None)
     
-    def _load_chat_history(self, chat_id: str) -> List[Message]:
+    @staticmethod
+    def _chat_path(chat_id: str) -> str:
+        """Путь к журналу чата (JSONL, одно сообщение на строку)."""
+        return os.path.join(CHATS_DIR, f"{chat_id}.jsonl")
+    
+    @staticmethod
+    def _legacy_chat_path(chat_id: str) -> str:
+        """Путь к истории чата в старом формате (единый JSON)."""
+        return os.path.join(CHATS_DIR, f"{chat_id}.json")
+    
+    @staticmethod
+    def _message_from_dict(msg_data: Dict) -> Message:
+        """Создает сообщение из сохраненного словаря."""
+        return Message(
+            msg_id=msg_data['id'],
+            sender=msg_data['sender'],
+            text=msg_data.get('text', ''),
+            timestamp=msg_data['timestamp'],
+            msg_type=msg_data['type'],
+            photo_path=msg_data.get('photo_path', '')
+        )
+    
+    @staticmethod
+    def _message_to_dict(msg: Message) -> Dict:
+        """Преобразует сообщение в словарь для сохранения."""
+        msg_dict = {
+            'id': msg.msg_id,
+            'sender': msg.sender,
+            'text': msg.text,
+            'timestamp': msg.timestamp,
+            'type': msg.msg_type
+        }
+        if msg.photo_path:
+            msg_dict['photo_path'] = msg.photo_path
+        return msg_dict
+    
+    @staticmethod
+    def _new_history(messages=()) -> Deque[Message]:
+        """Создает историю чата, ограниченную MAX_MESSAGES_IN_HISTORY сообщениями."""
+        return deque(messages, maxlen=MAX_MESSAGES_IN_HISTORY)
+    
+    def _load_chat_history(self, chat_id: str) -> Deque[Message]:
         """Загружает историю конкретного чата."""
-        chat_path = os.path.join(CHATS_DIR, f"{chat_id}.json")
+        chat_path = self._chat_path(chat_id)
         if not os.path.exists(chat_path):
-            return []
+            return self._load_legacy_chat_history(chat_id)
         try:
-            with open(chat_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if not content:
-                    return []
-                data = json.loads(content)
-                messages = []
-                for msg_data in data.get('messages', []):
-                    msg = Message(
-                        msg_id=msg_data['id'],
-                        sender=msg_data['sender'],
-                        text=msg_data.get('text', ''),
-                        timestamp=msg_data['timestamp'],
-                        msg_type=msg_data['type'],
-                        photo_path=msg_data.get('photo_path', '')
-                    )
-                    messages.append(msg)
-                return messages
+            # Журнал после компактизации невелик - читаем его целиком одним вызовом
+            lines = Path(chat_path).read_bytes().splitlines()
+            self._line_counts[chat_id] = len(lines)
+            
+            messages = self._new_history()
+            for line in lines[-MAX_MESSAGES_IN_HISTORY:]:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    messages.append(self._message_from_dict(json_loads(line)))
+                except ValueError:
+                    # Недописанная строка после аварийного завершения
+                    continue
+            return messages
         except Exception as e:
             print(f"Ошибка загрузки чата {chat_id}: {e}")
-            return []
+            return self._new_history()
     
-    def save_chat_history(self, chat_id: str):
-        """Сохраняет историю чата."""
-        if chat_id not in self.chats:
-            return
+    def _load_legacy_chat_history(self, chat_id: str) -> Deque[Message]:
+        """Загружает историю чата из старого JSON-формата."""
+        chat_path = self._legacy_chat_path(chat_id)
+        if not os.path.exists(chat_path):
+            return self._new_history()
+        try:
+            content = Path(chat_path).read_bytes()
+            if not content.strip():
+                return self._new_history()
+            data = json_loads(content)
+            return self._new_history(self._message_from_dict(msg_data) for msg_data in data.get('messages', []))
+        except Exception as e:
+            print(f"Ошибка загрузки чата {chat_id}: {e}")
+            return self._new_history()
+    
+    def save_chat_history(self, chat_id: str, upto: Optional[Message] = None):
+        """Полностью перезаписывает журнал чата последними сообщениями (компактизация).
         
-        chat_type = 'group' if chat_id in self.groups else 'private'
-        character_id = None if chat_type == 'group' else chat_id
+        Если задан upto, сохраняются только сообщения до него включительно.
+        """
+        history = self.chats.get(chat_id)
+        if history is None:
+            return
         
-        messages_data = []
-        for msg in self.chats[chat_id][-MAX_MESSAGES_IN_HISTORY:]:
-            msg_dict = {
-                'id': msg.msg_id,
-                'sender': msg.sender,
-                'text': msg.text,
-                'timestamp': msg.timestamp,
-                'type': msg.msg_type
-            }
-            if msg.photo_path:
-                msg_dict['photo_path'] = msg.photo_path
-            messages_data.append(msg_dict)
+        # Снимок: UI-поток может дописывать в deque, пока мы пишем файл
+        messages = list(history)
+        if upto is not None:
+            end = len(messages)
+            while end and messages[end - 1] is not upto:
+                end -= 1
+            if not end:
+                # upto уже вытеснено из истории - следующая пачка запишет чат целиком
+                return
+            del messages[end:]
+        chat_path = self._chat_path(chat_id)
+        tmp_path = chat_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(json_dumps(self._message_to_dict(msg)) + b'\n' for msg in messages))
+        os.replace(tmp_path, chat_path)
+        self._line_counts[chat_id] = len(messages)
         
-        chat_data = {
-            'chat_id': chat_id,
-            'chat_type': chat_type,
-            'character_id': character_id,
-            'messages': messages_data
-        }
+        legacy_path = self._legacy_chat_path(chat_id)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+    
+    def _append_to_history(self, chat_id: str, batch: List[Message]):
+        """Дописывает сообщения в конец журнала чата."""
+        line_count = self._line_counts.get(chat_id)
+        if line_count is None or line_count + len(batch) > 2 * MAX_MESSAGES_IN_HISTORY:
+            # Журнала еще нет (новый чат или старый формат) или он разросся - пишем целиком
+            self.save_chat_history(chat_id, upto=batch[-1])
+            return
         
-        chat_path = os.path.join(CHATS_DIR, f"{chat_id}.json")
-        with open(chat_path, 'w', encoding='utf-8') as f:
-            json.dump(chat_data, f, ensure_ascii=False, indent=2)
+        with open(self._chat_path(chat_id), 'ab') as f:
+            f.write(b''.join(json_dumps(self._message_to_dict(msg)) + b'\n' for msg in batch))
+        self._line_counts[chat_id] = line_count + len(batch)
+    
+    def _writer_loop(self):
+        """Фоновая запись: собирает сообщения пачками и пишет каждый чат одним вызовом."""
+        running = True
+        while running:
+            item = self._save_queue.get()
+            pending: Dict[str, List[Message]] = {}
+            # Ждем паузы в SAVE_DEBOUNCE_INTERVAL, но не дольше SAVE_MAX_DELAY с первого сообщения
+            deadline = time.monotonic() + SAVE_MAX_DELAY
+            while True:
+                if item is None:
+                    running = False
+                    break
+                chat_id, msg = item
+                pending.setdefault(chat_id, []).append(msg)
+                
+                timeout = min(SAVE_DEBOUNCE_INTERVAL, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._save_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            
+            for chat_id, batch in pending.items():
+                try:
+                    self._append_to_history(chat_id, batch)
+                except Exception as e:
+                    print(f"Ошибка сохранения чата {chat_id}: {e}")
     
     def add_message(self, chat_id: str, sender: str, text: str, msg_type: str = 'text', photo_path: str = ''):
         """Добавляет сообщение в чат."""
-        if chat_id not in self.chats:
-            self.chats[chat_id] = []
+        messages = self.get_chat_messages(chat_id)
         
+        now_ns = time.time_ns()
         msg = Message(
-            msg_id=f"msg_{int(datetime.now().timestamp() * 1000)}",
+            msg_id=f"msg_{now_ns}_{next(_ID_COUNTER)}",
             sender=sender,
             text=text,
-            timestamp=datetime.now().isoformat(),
+            timestamp=datetime.fromtimestamp(now_ns / 1e9).isoformat(),
             msg_type=msg_type,
             photo_path=photo_path
         )
-        self.chats[chat_id].append(msg)
-        self.save_chat_history(chat_id)
+        messages.append(msg)
+        self._save_queue.put((chat_id, msg))
         return msg
     
-    def get_chat_messages(self, chat_id: str) -> List[Message]:
-        """Возвращает сообщения чата."""
-        return self.chats.get(chat_id, [])
+    def get_chat_messages(self, chat_id: str) -> Deque[Message]:
+        """Возвращает сообщения чата, при необходимости загружая историю с диска."""
+        messages = self.chats.get(chat_id)
+        if messages is None:
+            messages = self._load_chat_history(chat_id)
+            self.chats[chat_id] = messages
+        return messages
     
-    def build_prompt(self, chat_id: str, character: Character, is_group: bool = False) -> str:
-        """Формирует промпт для API."""
-        system_prompt = character.group_prompt if is_group else character.private_prompt
+    def get_recent_messages(self, chat_id: str, count: int) -> List[Message]:
+        """Снимок последних count сообщений чата."""
+        # С конца deque: обходим только нужные count элементов, а не всю историю
+        recent = list(islice(reversed(self.get_chat_messages(chat_id)), count))
+        recent.reverse()
+        return recent
+    
+    def _display_name(self, sender: str) -> str:
+        """Возвращает отображаемое имя отправителя."""
+        name = self._name_cache.get(sender)
+        if name is None:
+            if sender == 'user':
+                name = "Пользователь"
+            else:
+                character = self.characters.get(sender)
+                name = character.name if character else sender
+            self._name_cache[sender] = name
+        return name
+    
+    def _system_prompt(self, chat_id: str, character: Character, is_group: bool) -> str:
+        """Возвращает системный промпт персонажа для чата (с кэшем)."""
+        group = self.groups.get(chat_id) if is_group else None
+        key = (chat_id, character.char_id, is_group,
+               (group.name, tuple(group.members)) if group else None)
+        system_prompt = self._sys_prompt_cache.get(key)
+        if system_prompt is not None:
+            return system_prompt
         
-        if is_group and chat_id in self.groups:
-            group = self.groups[chat_id]
-            members_names = ', '.join([
-                self.characters.get(m, Character(m, m, '', '', [])).name 
-                for m in group.members
-            ])
+        system_prompt = character.group_prompt if is_group else character.private_prompt
+        if group:
+            members_names = ', '.join(self._display_name(m) for m in group.members)
             system_prompt = system_prompt.format(
                 group_name=group.name,
                 members=members_names
             )
+        self._sys_prompt_cache[key] = system_prompt
+        return system_prompt
+    
+    def build_prompt(self, chat_id: str, character: Character, is_group: bool = False) -> str:
+        """Формирует промпт для API."""
+        system_prompt = self._system_prompt(chat_id, character, is_group)
         
-        messages = self.chats.get(chat_id, [])[-MAX_MESSAGES_FOR_API:]
-        history_text = ""
-        for msg in messages:
-            if msg.msg_type == 'text':
-                sender_name = "Пользователь" if msg.sender == 'user' else \
-                              self.characters.get(msg.sender, Character(msg.sender, msg.sender, '', '', [])).name
-                history_text += f"{sender_name}: {msg.text}\n"
+        history_text = self._history_text(chat_id)
         
         return f"{system_prompt}\n\nИстория переписки:\n{history_text}\nОтветь на последнее сообщение."
     
+    def _history_text(self, chat_id: str) -> str:
+        """Текст последних MAX_MESSAGES_FOR_API сообщений; форматируются только новые с прошлого вызова."""
+        messages = self.get_recent_messages(chat_id, MAX_MESSAGES_FOR_API)
+        with self._history_lock:
+            lines = self._history_lines.get(chat_id)
+            new_from = 0
+            if lines:
+                last_formatted = lines[-1][0]
+                new_from = next((i + 1 for i in range(len(messages) - 1, -1, -1)
+                                 if messages[i] is last_formatted), 0)
+                if not new_from:
+                    # Кэш отстал больше чем на окно - собираем заново
+                    lines = None
+            if lines is None:
+                lines = deque(maxlen=MAX_MESSAGES_FOR_API)
+                self._history_lines[chat_id] = lines
+            
+            display_name = self._display_name
+            append = lines.append
+            for msg in messages[new_from:]:
+                append((msg, f"{display_name(msg.sender)}: {msg.text}\n" if msg.msg_type == 'text' else ''))
+            return ''.join(line for _, line in lines)
+    
     def create_group(self, name: str, members: List[str]) -> str:
         """Создает новую группу."""
-        group_id = f"group_{int(datetime.now().timestamp())}"
+        group_id = f"group_{time.time_ns()}_{next(_ID_COUNTER)}"
         group = Group(
             group_id=group_id,
             name=name,
@@ -196,6 +380,7 @@ class ChatManager:
             group_context=f"Групповой чат '{name}'"
         )
         self.groups[group_id] = group
+        self._chat_view = None
         
         group_data = {
             'id': group_id,
@@ -205,8 +390,7 @@ class ChatManager:
         }
         
         group_path = os.path.join(GROUPS_DIR, f"{group_id}.yml")
-        with open(group_path, 'w', encoding='utf-8') as f:
-            yaml.dump(group_data, f, allow_unicode=True, default_flow_style=False)
+        dump_yaml(group_data, group_path)
         
-        self.chats[group_id] = []
+        self.chats[group_id] = self._new_history()
         return group_id
@@ -0,0 +1,110 @@
+# core/storage.py
+# -*- coding: utf-8 -*-
+"""
+Чтение и запись файлов данных
+"""
+import hashlib
+import os
+import yaml
+from typing import Any, Dict, Tuple
+from config.settings import CACHE_DIR
+
+# C-реализация (libyaml) заметно быстрее чистого Python, если доступна
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+# orjson в несколько раз быстрее стандартного json; без него работаем на stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+# Кэш разобранных YAML-файлов: путь -> ((mtime_ns, размер), данные)
+_YAML_CACHE: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+# JSON-копии разобранных YAML между запусками: один файл на исходный путь
+_YAML_JSON_CACHE_DIR = os.path.join(CACHE_DIR, "yaml")
+
+def load_yaml_cached(path: str, json_cache: bool = True) -> Any:
+    """Загружает YAML, повторно разбирая файл только при изменении mtime или размера; json_cache=False - без копии на диске."""
+    st = os.stat(path)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    cached = _YAML_CACHE.get(path)
+    if cached and cached[0] == stat_key:
+        return cached[1]
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if json_cache:
+        data = _parse_yaml_with_json_cache(path, raw)
+    else:
+        data = yaml.load(raw, Loader=SafeLoader)
+    _YAML_CACHE[path] = (stat_key, data)
+    return data
+
+def _parse_yaml_with_json_cache(path: str, raw: bytes) -> Any:
+    """Разбирает YAML, используя JSON-копию с диска, если содержимое не менялось."""
+    path_key = hashlib.blake2b(os.path.abspath(path).encode('utf-8'), digest_size=16).hexdigest()
+    cache_path = os.path.join(_YAML_JSON_CACHE_DIR, f"{path_key}.json")
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = json_loads(f.read())
+        if cached['digest'] == digest:
+            return cached['data']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    data = yaml.load(raw, Loader=SafeLoader)
+    try:
+        payload = json_dumps({'digest': digest, 'data': data})
+        # Даты и прочие не-JSON типы YAML вернулись бы из копии строками - такие файлы не кэшируем
+        if json_loads(payload)['data'] == data:
+            os.makedirs(_YAML_JSON_CACHE_DIR, exist_ok=True)
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, cache_path)
+            return data
+    except (OSError, TypeError):
+        # Кэш необязателен: несериализуемые данные или нет прав на запись
+        pass
+    # Копия от прежнего содержимого файла больше не нужна
+    try:
+        os.remove(cache_path)
+    except OSError:
+        pass
+    return data
+
+if orjson is not None:
+    def json_dumps(data: Any) -> bytes:
+        """Сериализует данные в компактный JSON (UTF-8)."""
+        return orjson.dumps(data)
+    
+    def json_loads(data: bytes) -> Any:
+        """Разбирает JSON из байтов или строки."""
+        return orjson.loads(data)
+else:
+    def json_dumps(data: Any) -> bytes:
+        """Сериализует данные в компактный JSON (UTF-8)."""
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    def json_loads(data: bytes) -> Any:
+        """Разбирает JSON из байтов или строки."""
+        return json.loads(data)
+
+def dump_yaml(data: Any, path: str):
+    """Атомарно сохраняет данные в YAML-файл; не трогает файл, если содержимое не изменилось."""
+    raw = yaml.dump(data, Dumper=SafeDumper, allow_unicode=True, default_flow_style=False, encoding='utf-8')
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == raw:
+                return
+    except OSError:
+        pass
+    
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(raw)
+    os.replace(tmp_path, path)
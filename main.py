@@ -10,7 +10,10 @@ def main():
     """Запуск приложения."""
     root = tk.Tk()
     app = MainWindow(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        app.close()
 
 if __name__ == "__main__":
     main()
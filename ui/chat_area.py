@@ -5,11 +5,15 @@
 """
 import tkinter as tk
 from tkinter import ttk
+from collections import OrderedDict
 from threading import Thread
+from concurrent.futures import as_completed
 from PIL import Image, ImageTk
 import os
-from config.settings import COLORS, AVATAR_SIZE
+from config.settings import (COLORS, AVATAR_SIZE, MESSAGES_RENDER_WINDOW, MESSAGES_RENDER_PAGE,
+                             PHOTO_PREVIEW_SIZE, PHOTO_CACHE_SIZE)
 from ui.components import generate_placeholder_avatar, format_timestamp
+from ui.styles import get_font
 
 class ChatArea(tk.Frame):
     """Область отображения чата."""
@@ -19,31 +23,50 @@ class ChatArea(tk.Frame):
         self.chat_manager = chat_manager
         self.api_manager = api_manager
         self.current_chat_id = None
+        # Считаются один раз при открытии чата, а не для каждого сообщения
+        self._current_is_group = False
+        self._current_sender_names = {}
+        # Отрисовывается только хвост истории; более старые сообщения - при прокрутке вверх
+        self._oldest_rendered = None
+        self._loading_older = False
+        # Какой чат сейчас отрисован и его последнее показанное сообщение
+        self._rendered_chat_id = None
+        self._last_rendered = None
+        # Готовые превью фото по пути к файлу (LRU)
+        self._photo_cache: "OrderedDict[str, ImageTk.PhotoImage]" = OrderedDict()
+        # Во время пакетной отрисовки scrollregion выставляется один раз в конце
+        self._batch_rendering = False
         
         self.create_widgets()
     
     def create_widgets(self):
         """Создает виджеты области чата."""
+        bg_secondary = COLORS['bg_secondary']
+        text_primary = COLORS['text_primary']
+        online = COLORS['online']
+        bg_primary = COLORS['bg_primary']
+        accent = COLORS['accent']
+        
         # Заголовок
-        self.chat_header = tk.Frame(self, bg=COLORS['bg_secondary'], height=70)
+        self.chat_header = tk.Frame(self, bg=bg_secondary, height=70)
         self.chat_header.pack(fill=tk.X)
         self.chat_header.pack_propagate(False)
         
-        header_content = tk.Frame(self.chat_header, bg=COLORS['bg_secondary'])
+        header_content = tk.Frame(self.chat_header, bg=bg_secondary)
         header_content.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
         
-        self.header_avatar_label = tk.Label(header_content, bg=COLORS['bg_secondary'])
+        self.header_avatar_label = tk.Label(header_content, bg=bg_secondary)
         self.header_avatar_label.pack(side=tk.LEFT, padx=(0, 15))
         
-        info_frame = tk.Frame(header_content, bg=COLORS['bg_secondary'])
+        info_frame = tk.Frame(header_content, bg=bg_secondary)
         info_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         self.header_name_label = tk.Label(
             info_frame,
             text="",
-            bg=COLORS['bg_secondary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 14, 'bold'),
+            bg=bg_secondary,
+            fg=text_primary,
+            font=get_font('header'),
             anchor='w'
         )
         self.header_name_label.pack(fill=tk.X)
@@ -51,45 +74,42 @@ class ChatArea(tk.Frame):
         self.header_status_label = tk.Label(
             info_frame,
             text="● онлайн",
-            bg=COLORS['bg_secondary'],
-            fg=COLORS['online'],
-            font=('Arial', 10),
+            bg=bg_secondary,
+            fg=online,
+            font=get_font('small'),
             anchor='w'
         )
         self.header_status_label.pack(fill=tk.X)
         
         # Область сообщений
-        messages_frame = tk.Frame(self, bg=COLORS['bg_primary'])
+        messages_frame = tk.Frame(self, bg=bg_primary)
         messages_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        self.messages_canvas = tk.Canvas(messages_frame, bg=COLORS['bg_primary'], highlightthickness=0)
-        messages_scrollbar = ttk.Scrollbar(messages_frame, orient="vertical", command=self.messages_canvas.yview)
-        self.messages_container = tk.Frame(self.messages_canvas, bg=COLORS['bg_primary'])
+        self.messages_canvas = tk.Canvas(messages_frame, bg=bg_primary, highlightthickness=0)
+        self.messages_scrollbar = ttk.Scrollbar(messages_frame, orient="vertical", command=self.messages_canvas.yview)
+        self.messages_container = tk.Frame(self.messages_canvas, bg=bg_primary)
         
-        self.messages_container.bind(
-            "<Configure>",
-            lambda e: self.messages_canvas.configure(scrollregion=self.messages_canvas.bbox("all"))
-        )
+        self.messages_container.bind("<Configure>", self._update_scrollregion)
         
         self.messages_canvas.create_window((0, 0), window=self.messages_container, anchor="nw")
-        self.messages_canvas.configure(yscrollcommand=messages_scrollbar.set)
+        self.messages_canvas.configure(yscrollcommand=self.on_messages_scroll)
         self.messages_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        messages_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.messages_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Поле ввода
-        input_frame = tk.Frame(self, bg=COLORS['bg_secondary'])
+        input_frame = tk.Frame(self, bg=bg_secondary)
         input_frame.pack(fill=tk.X, padx=10, pady=10)
         
-        buttons_frame = tk.Frame(input_frame, bg=COLORS['bg_secondary'])
+        buttons_frame = tk.Frame(input_frame, bg=bg_secondary)
         buttons_frame.pack(side=tk.LEFT, padx=(10, 5))
         
         self.message_text = tk.Text(
             input_frame,
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_primary'],
-            insertbackground=COLORS['text_primary'],
+            bg=bg_primary,
+            fg=text_primary,
+            insertbackground=text_primary,
             relief=tk.FLAT,
-            font=('Arial', 11),
+            font=get_font('body'),
             height=3,
             wrap=tk.WORD
         )
@@ -100,10 +120,10 @@ class ChatArea(tk.Frame):
         send_btn = tk.Button(
             input_frame,
             text="📤",
-            bg=COLORS['accent'],
-            fg=COLORS['text_primary'],
+            bg=accent,
+            fg=text_primary,
             relief=tk.FLAT,
-            font=('Arial', 16),
+            font=get_font('icon'),
             cursor='hand2',
             width=3,
             command=self.send_message
@@ -119,6 +139,11 @@ class ChatArea(tk.Frame):
     def open_chat(self, chat_id):
         """Открывает чат."""
         self.current_chat_id = chat_id
+        self._current_is_group = chat_id in self.chat_manager.groups
+        # Все персонажи, а не только участники: в истории могут быть и вышедшие из группы
+        self._current_sender_names = {
+            char_id: character.name for char_id, character in self.chat_manager.characters.items()
+        } if self._current_is_group else {}
         
         # Обновляем заголовок
         if chat_id in self.chat_manager.characters:
@@ -133,44 +158,144 @@ class ChatArea(tk.Frame):
         self.header_avatar_label.image = avatar
         self.header_name_label.config(text=name)
         
-        # Отображаем сообщения
+        # Отображаем сообщения: если чат уже отрисован, дорисовываем только новые
+        if chat_id == self._rendered_chat_id and self._render_new_messages():
+            return
         self.display_messages()
     
+    def _render_new_messages(self):
+        """Дорисовывает сообщения после последнего показанного; False - нужна полная перерисовка."""
+        messages = list(self.chat_manager.get_chat_messages(self.current_chat_id))
+        last = self._last_rendered
+        if last is None:
+            return not messages
+        
+        start = next((i + 1 for i in range(len(messages) - 1, -1, -1) if messages[i] is last), 0)
+        if not start:
+            return False
+        for msg in messages[start:]:
+            self.add_message_to_display(msg)
+        if start < len(messages):
+            self.messages_canvas.yview_moveto(1.0)
+        return True
+    
+    def _show_new_messages(self, chat_id):
+        """Показывает новые сообщения чата, если он сейчас открыт."""
+        if chat_id != self.current_chat_id:
+            return
+        if not self._render_new_messages():
+            self.display_messages()
+    
     def display_messages(self):
-        """Отображает сообщения чата."""
+        """Отображает последние сообщения чата."""
         for widget in self.messages_container.winfo_children():
             widget.destroy()
         
-        messages = self.chat_manager.get_chat_messages(self.current_chat_id)
-        for msg in messages:
-            self.add_message_to_display(msg)
+        messages = self.chat_manager.get_recent_messages(self.current_chat_id, MESSAGES_RENDER_WINDOW)
+        self._oldest_rendered = messages[0] if messages else None
+        self._rendered_chat_id = self.current_chat_id
+        self._last_rendered = None
         
-        self.messages_canvas.update_idletasks()
+        # Пока прокрутка не встала вниз, не подгружаем старые сообщения
+        self._loading_older = True
+        # Пересчет scrollregion на каждый <Configure> не нужен: выставим его один раз в конце
+        self._batch_rendering = True
+        try:
+            for msg in messages:
+                self.add_message_to_display(msg)
+            
+            self.messages_canvas.update_idletasks()
+        finally:
+            self._batch_rendering = False
+        self._update_scrollregion()
         self.messages_canvas.yview_moveto(1.0)
+        self._loading_older = False
+    
+    def _update_scrollregion(self, event=None):
+        """Подгоняет область прокрутки под содержимое."""
+        if self._batch_rendering:
+            return
+        # Контейнер - единственный элемент холста в (0, 0): его размер и есть область прокрутки,
+        # без обхода всех элементов через bbox("all")
+        if event is not None:
+            width, height = event.width, event.height
+        else:
+            width = self.messages_container.winfo_reqwidth()
+            height = self.messages_container.winfo_reqheight()
+        self.messages_canvas.configure(scrollregion=(0, 0, width, height))
     
-    def add_message_to_display(self, message):
-        """Добавляет сообщение в отображение."""
+    def on_messages_scroll(self, first, last):
+        """Обновляет полосу прокрутки и подгружает старые сообщения у верхнего края."""
+        self.messages_scrollbar.set(first, last)
+        if float(first) <= 0.0 and self._oldest_rendered is not None and not self._loading_older:
+            self._loading_older = True
+            self.after_idle(self._render_older_messages)
+    
+    def _render_older_messages(self):
+        """Дорисовывает сверху очередную порцию более старых сообщений."""
+        self._loading_older = False
+        oldest = self._oldest_rendered
+        if oldest is None:
+            return
+        
+        # Снимок истории: ответы персонажей дописываются в нее из других потоков
+        messages = list(self.chat_manager.get_chat_messages(self.current_chat_id))
+        end = next((i for i in range(len(messages) - 1, -1, -1) if messages[i] is oldest), 0)
+        if end == 0:
+            self._oldest_rendered = None
+            return
+        
+        start = max(0, end - MESSAGES_RENDER_PAGE)
+        # winfo_children() идет в порядке создания, а не упаковки: верхнее сообщение - первое в pack_slaves()
+        anchor = self.messages_container.pack_slaves()[0]
+        old_height = self.messages_container.winfo_reqheight()
+        self._batch_rendering = True
+        try:
+            for msg in messages[start:end]:
+                self.add_message_to_display(msg, before=anchor)
+            self._oldest_rendered = messages[start]
+            
+            self.messages_canvas.update_idletasks()
+        finally:
+            self._batch_rendering = False
+        self._update_scrollregion()
+        
+        # Сохраняем видимую позицию: сдвигаемся на высоту добавленных сообщений
+        new_height = self.messages_container.winfo_reqheight()
+        if new_height > 0:
+            self.messages_canvas.yview_moveto((new_height - old_height) / new_height)
+    
+    def add_message_to_display(self, message, before=None):
+        """Добавляет сообщение в отображение (в конец или перед виджетом before)."""
+        bg_primary = COLORS['bg_primary']
+        text_secondary = COLORS['text_secondary']
+        bg_chat_user = COLORS['bg_chat_user']
+        bg_chat_character = COLORS['bg_chat_character']
+        text_primary = COLORS['text_primary']
+        
         sender = message.sender
         is_user = sender == 'user'
         
         # Контейнер сообщения
-        msg_container = tk.Frame(self.messages_container, bg=COLORS['bg_primary'])
-        msg_container.pack(fill=tk.X, pady=5, padx=20)
+        msg_container = tk.Frame(self.messages_container, bg=bg_primary)
+        msg_container.pack(fill=tk.X, pady=5, padx=20, before=before)
+        if before is None:
+            self._last_rendered = message
         
         # ВАЖНО: для групповых чатов не показываем имя собеседника справа
-        if not is_user and self.current_chat_id in self.chat_manager.groups:
-            char_name = self.chat_manager.characters.get(sender).name if sender in self.chat_manager.characters else sender
+        if not is_user and self._current_is_group:
+            char_name = self._current_sender_names.get(sender, sender)
             name_label = tk.Label(
                 msg_container,
                 text=char_name,
-                bg=COLORS['bg_primary'],
-                fg=COLORS['text_secondary'],
-                font=('Arial', 9, 'bold')
+                bg=bg_primary,
+                fg=text_secondary,
+                font=get_font('caption_bold')
             )
             name_label.pack(anchor='w')
         
         # Фрейм сообщения
-        bg_color = COLORS['bg_chat_user'] if is_user else COLORS['bg_chat_character']
+        bg_color = bg_chat_user if is_user else bg_chat_character
         msg_frame = tk.Frame(msg_container, bg=bg_color)
         
         if is_user:
@@ -184,8 +309,8 @@ class ChatArea(tk.Frame):
                 msg_frame,
                 text=message.text,
                 bg=bg_color,
-                fg=COLORS['text_primary'],
-                font=('Arial', 11),
+                fg=text_primary,
+                font=get_font('body'),
                 wraplength=400,
                 justify=tk.LEFT,
                 padx=12,
@@ -193,31 +318,49 @@ class ChatArea(tk.Frame):
             )
             text_label.pack()
         elif message.msg_type == 'photo' and message.photo_path:
-            if os.path.exists(message.photo_path):
-                try:
-                    img = Image.open(message.photo_path)
-                    img.thumbnail((300, 300))
-                    photo = ImageTk.PhotoImage(img)
-                    photo_label = tk.Label(msg_frame, image=photo, bg=bg_color)
-                    photo_label.image = photo
-                    photo_label.pack(padx=5, pady=5)
-                except:
-                    pass
+            photo = self._get_photo_preview(message.photo_path)
+            if photo is not None:
+                photo_label = tk.Label(msg_frame, image=photo, bg=bg_color)
+                photo_label.image = photo
+                photo_label.pack(padx=5, pady=5)
         
         # Временная метка
         timestamp = format_timestamp(message.timestamp)
         time_label = tk.Label(
             msg_container,
             text=timestamp,
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_secondary'],
-            font=('Arial', 8)
+            bg=bg_primary,
+            fg=text_secondary,
+            font=get_font('tiny')
         )
         if is_user:
             time_label.pack(side=tk.RIGHT, padx=(0, 5))
         else:
             time_label.pack(side=tk.LEFT, padx=(5, 0))
     
+    def _get_photo_preview(self, photo_path):
+        """Возвращает уменьшенное фото для сообщения, декодируя файл только при первом показе."""
+        photo = self._photo_cache.get(photo_path)
+        if photo is not None:
+            self._photo_cache.move_to_end(photo_path)
+            return photo
+        
+        if not os.path.exists(photo_path):
+            return None
+        try:
+            with Image.open(photo_path) as img:
+                # Для JPEG декодер сразу уменьшает картинку в 2-8 раз
+                img.draft('RGB', PHOTO_PREVIEW_SIZE)
+                img.thumbnail(PHOTO_PREVIEW_SIZE, Image.Resampling.LANCZOS)
+                photo = ImageTk.PhotoImage(img)
+        except:
+            return None
+        
+        self._photo_cache[photo_path] = photo
+        if len(self._photo_cache) > PHOTO_CACHE_SIZE:
+            self._photo_cache.popitem(last=False)
+        return photo
+    
     def send_message(self):
         """Отправляет сообщение."""
         if not self.current_chat_id:
@@ -230,9 +373,8 @@ class ChatArea(tk.Frame):
         self.message_text.delete("1.0", tk.END)
         
         # Добавляем сообщение пользователя
-        msg = self.chat_manager.add_message(self.current_chat_id, 'user', text)
-        self.add_message_to_display(msg)
-        self.messages_canvas.yview_moveto(1.0)
+        self.chat_manager.add_message(self.current_chat_id, 'user', text)
+        self._show_new_messages(self.current_chat_id)
         
         # Получаем ответ в потоке
         Thread(target=self.get_character_response, args=(text,), daemon=True).start()
@@ -242,31 +384,95 @@ class ChatArea(tk.Frame):
         is_group = self.current_chat_id in self.chat_manager.groups
         
         if is_group:
-            group = self.chat_manager.groups[self.current_chat_id]
+            chat_id = self.current_chat_id
+            group = self.chat_manager.groups[chat_id]
+            # Запросы ко всем участникам уходят параллельно, ответы показываем по готовности
+            futures = {}
             for member_id in group.members:
                 if member_id not in self.chat_manager.characters:
                     continue
                 character = self.chat_manager.characters[member_id]
-                prompt = self.chat_manager.build_prompt(self.current_chat_id, character, True)
-                
+                prompt = self.chat_manager.build_prompt(chat_id, character, True)
+                futures[self.api_manager.send_message_async(prompt)] = member_id
+            
+            for future in as_completed(futures):
+                member_id = futures[future]
                 try:
-                    response = self.api_manager.send_message(prompt)
+                    response = future.result()
                     if '[IGNORE]' in response:
                         continue
                     
-                    msg = self.chat_manager.add_message(self.current_chat_id, member_id, response)
-                    self.after(0, lambda m=msg: self.add_message_to_display(m))
-                    self.after(0, lambda: self.messages_canvas.yview_moveto(1.0))
+                    self.chat_manager.add_message(chat_id, member_id, response)
+                    self.after_idle(self._show_new_messages, chat_id)
                 except Exception as e:
                     print(f"Ошибка: {e}")
         else:
-            character = self.chat_manager.characters.get(self.current_chat_id)
+            chat_id = self.current_chat_id
+            character = self.chat_manager.characters.get(chat_id)
             if character:
-                prompt = self.chat_manager.build_prompt(self.current_chat_id, character, False)
+                prompt = self.chat_manager.build_prompt(chat_id, character, False)
+                # Ответ показываем по мере генерации во временном пузыре
+                bubble = {'pending': [], 'scheduled': False}
+                self.after_idle(self._begin_stream_bubble, bubble)
                 try:
-                    response = self.api_manager.send_message(prompt)
-                    msg = self.chat_manager.add_message(self.current_chat_id, self.current_chat_id, response)
-                    self.after(0, lambda: self.add_message_to_display(msg))
-                    self.after(0, lambda: self.messages_canvas.yview_moveto(1.0))
+                    parts = []
+                    for chunk in self.api_manager.stream_message(prompt):
+                        parts.append(chunk)
+                        self._queue_stream_chunk(bubble, chunk)
+                    response = ''.join(parts).strip() or "Ответ пустой"
+                    msg = self.chat_manager.add_message(chat_id, chat_id, response)
+                    self.after_idle(self._finish_stream_bubble, bubble, chat_id, msg)
                 except Exception as e:
                     print(f"Ошибка: {e}")
+                    self.after_idle(self._finish_stream_bubble, bubble, chat_id, None)
+    
+    def _begin_stream_bubble(self, bubble):
+        """Создает пузырь для ответа, который приходит по частям."""
+        container = tk.Frame(self.messages_container, bg=COLORS['bg_primary'])
+        container.pack(fill=tk.X, pady=5, padx=20)
+        msg_frame = tk.Frame(container, bg=COLORS['bg_chat_character'])
+        msg_frame.pack(side=tk.LEFT)
+        label = tk.Label(
+            msg_frame,
+            text="...",
+            bg=COLORS['bg_chat_character'],
+            fg=COLORS['text_primary'],
+            font=get_font('body'),
+            wraplength=400,
+            justify=tk.LEFT,
+            padx=12,
+            pady=8
+        )
+        label.pack()
+        bubble['container'] = container
+        bubble['label'] = label
+        bubble['text'] = ''
+        self.messages_canvas.yview_moveto(1.0)
+    
+    def _queue_stream_chunk(self, bubble, chunk):
+        """Копит фрагменты из рабочего потока; пузырь обновляется один раз на пачку."""
+        bubble['pending'].append(chunk)
+        if not bubble['scheduled']:
+            bubble['scheduled'] = True
+            self.after_idle(self._flush_stream_chunks, bubble)
+    
+    def _flush_stream_chunks(self, bubble):
+        """Дописывает накопленные фрагменты ответа в пузырь."""
+        bubble['scheduled'] = False
+        label = bubble.get('label')
+        if label is None or not label.winfo_exists():
+            return
+        pending = bubble['pending']
+        count = len(pending)
+        bubble['text'] += ''.join(pending[:count])
+        del pending[:count]
+        label.config(text=bubble['text'])
+        self.messages_canvas.yview_moveto(1.0)
+    
+    def _finish_stream_bubble(self, bubble, chat_id, msg):
+        """Заменяет временный пузырь готовым сообщением."""
+        container = bubble.get('container')
+        if container is not None and container.winfo_exists():
+            container.destroy()
+        if msg is not None:
+            self._show_new_messages(chat_id)
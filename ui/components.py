@@ -3,47 +3,157 @@
 """
 UI компоненты (генерация аватарок, утилиты)
 """
-from PIL import Image, ImageTk, ImageDraw
-from colorsys import hsv_to_rgb
+import os
+import threading
+import zlib
+from PIL import Image, ImageTk, ImageDraw, ImageFont
 from datetime import datetime
-from config.settings import AVATAR_SIZE
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+from config.settings import AVATAR_SIZE, CACHE_DIR
+
+# Готовые аватарки по (имя, размер). Словарь, а не lru_cache: PhotoImage живет, пока жив Tk
+_AVATAR_CACHE: Dict[Tuple[str, int], ImageTk.PhotoImage] = {}
+# Картинки, подготовленные фоновым потоком; в PhotoImage их превращает только поток Tk
+_AVATAR_IMAGES: Dict[Tuple[str, int], Image.Image] = {}
+# Установлен, пока фоновый поток готовит аватарки
+_PREWARM_RUNNING = threading.Event()
+# Отрисованные аватарки между запусками
+_AVATAR_DISK_DIR = os.path.join(CACHE_DIR, "avatars")
+# Версия отрисовки в имени файла кэша: увеличивать при любом изменении _render_avatar
+_AVATAR_RENDER_VERSION = 1
+# Файлы других версий удаляются один раз за запуск, при первой записи в кэш
+_stale_avatars_pruned = False
+
+@lru_cache(maxsize=None)
+def _get_font(font_size: int):
+    """Загружает шрифт нужного размера один раз."""
+    try:
+        return ImageFont.truetype("arial.ttf", font_size)
+    except:
+        try:
+            return ImageFont.load_default()
+        except:
+            return None
 
 def generate_placeholder_avatar(name: str, size: int = AVATAR_SIZE):
     """Генерирует заглушку аватарки с первой буквой имени."""
-    color_hash = hash(name) % 360
-    r, g, b = hsv_to_rgb(color_hash / 360, 0.6, 0.9)
-    bg_color = (int(r * 255), int(g * 255), int(b * 255))
+    key = (name, size)
+    avatar = _AVATAR_CACHE.get(key)
+    if avatar is None:
+        image = _AVATAR_IMAGES.pop(key, None) or _load_or_render_avatar(name, size)
+        avatar = _AVATAR_CACHE[key] = ImageTk.PhotoImage(image)
+    return avatar
+
+def get_cached_avatar(name: str, size: int = AVATAR_SIZE):
+    """Возвращает уже готовую аватарку или None, ничего не рисуя."""
+    key = (name, size)
+    avatar = _AVATAR_CACHE.get(key)
+    if avatar is None:
+        image = _AVATAR_IMAGES.pop(key, None)
+        if image is not None:
+            avatar = _AVATAR_CACHE[key] = ImageTk.PhotoImage(image)
+    return avatar
+
+def start_avatar_prewarm(names: Iterable[str], size: int = AVATAR_SIZE):
+    """Запускает фоновый поток, заранее готовящий картинки аватарок."""
+    _PREWARM_RUNNING.set()
+    threading.Thread(
+        target=_prewarm_avatars, args=(list(names), size), name='avatar-prewarm', daemon=True
+    ).start()
+
+def avatar_prewarm_running() -> bool:
+    """Проверяет, готовит ли еще фоновый поток аватарки."""
+    return _PREWARM_RUNNING.is_set()
+
+def _prewarm_avatars(names: List[str], size: int):
+    """Готовит картинки аватарок в фоновом потоке; Tk не трогает."""
+    try:
+        for name in names:
+            key = (name, size)
+            if key in _AVATAR_CACHE or key in _AVATAR_IMAGES:
+                continue
+            image = _load_or_render_avatar(name, size)
+            # Пока картинка рисовалась, поток Tk мог уже сделать эту аватарку сам
+            if key not in _AVATAR_CACHE:
+                _AVATAR_IMAGES[key] = image
+    finally:
+        _PREWARM_RUNNING.clear()
+
+def _load_or_render_avatar(name: str, size: int) -> Image.Image:
+    """Берет аватарку из дискового кэша или рисует и сохраняет ее."""
+    path = os.path.join(_AVATAR_DISK_DIR, f"v{_AVATAR_RENDER_VERSION}_{_name_hash(name):08x}_{size}.png")
+    try:
+        with Image.open(path) as cached:
+            cached.load()
+            return cached
+    except (OSError, ValueError):
+        pass
     
+    image = _render_avatar(name, size)
+    try:
+        os.makedirs(_AVATAR_DISK_DIR, exist_ok=True)
+        _prune_stale_avatars()
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format='PNG')
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return image
+
+def _prune_stale_avatars():
+    """Удаляет из дискового кэша аватарки, нарисованные другой версией _render_avatar."""
+    global _stale_avatars_pruned
+    if _stale_avatars_pruned:
+        return
+    _stale_avatars_pruned = True
+    prefix = f"v{_AVATAR_RENDER_VERSION}_"
+    with os.scandir(_AVATAR_DISK_DIR) as it:
+        stale = [entry.path for entry in it if entry.name.endswith('.png') and not entry.name.startswith(prefix)]
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _name_hash(name: str) -> int:
+    """Стабильный между запусками хэш имени (hash() зависит от PYTHONHASHSEED)."""
+    return zlib.crc32(name.encode('utf-8'))
+
+def _avatar_color(hue: int) -> Tuple[int, int, int]:
+    """HSV -> RGB для оттенка hue (0-359) при S=0.6, V=0.9 (то же, что colorsys.hsv_to_rgb)."""
+    v = 0.9
+    p = v * (1.0 - 0.6)
+    sector, f = divmod(hue / 60.0, 1.0)
+    q = v * (1.0 - 0.6 * f)
+    t = v * (1.0 - 0.6 * (1.0 - f))
+    r, g, b = ((v, t, p), (q, v, p), (p, v, t), (p, q, v), (t, p, v), (v, p, q))[int(sector) % 6]
+    return int(r * 255), int(g * 255), int(b * 255)
+
+def _render_avatar(name: str, size: int) -> Image.Image:
+    """Рисует аватарку-заглушку."""
+    bg_color = _avatar_color(_name_hash(name) % 360)
+    
+    # Фон уже залит цветом при создании, отдельный круг того же цвета не нужен
     image = Image.new('RGB', (size, size), bg_color)
     draw = ImageDraw.Draw(image)
-    draw.ellipse([0, 0, size, size], fill=bg_color)
     
-    try:
-        from PIL import ImageFont
-        font_size = int(size * 0.5)
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-    except:
-        font = None
+    font = _get_font(int(size * 0.5))
     
     letter = name[0].upper() if name else '?'
     
-    if font:
-        bbox = draw.textbbox((0, 0), letter, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
+    if isinstance(font, ImageFont.FreeTypeFont):
+        # Центрирование средствами FreeType, без отдельного textbbox
+        draw.text((size / 2, size / 2), letter, fill='white', font=font, anchor='mm')
     else:
-        text_width = size // 3
-        text_height = size // 3
-    
-    text_x = (size - text_width) // 2
-    text_y = (size - text_height) // 2
-    draw.text((text_x, text_y), letter, fill='white', font=font)
+        # Растровый шрифт по умолчанию не поддерживает anchor
+        text_x = (size - size // 3) // 2
+        text_y = (size - size // 3) // 2
+        draw.text((text_x, text_y), letter, fill='white', font=font)
     
-    return ImageTk.PhotoImage(image)
+    return image
 
+@lru_cache(maxsize=4096)
 def format_timestamp(iso_timestamp: str) -> str:
     """Форматирует ISO timestamp в читаемый формат."""
     try:
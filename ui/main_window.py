@@ -4,12 +4,13 @@
 Главное окно приложения
 """
 import tkinter as tk
-from config.settings import WINDOW_WIDTH, WINDOW_HEIGHT, MIN_WIDTH, MIN_HEIGHT, COLORS
+from config.settings import WINDOW_WIDTH, WINDOW_HEIGHT, MIN_WIDTH, MIN_HEIGHT, COLORS, AVATAR_SIZE_SMALL
 from core.api_manager import APIManager
 from core.chat_manager import ChatManager
 from ui.sidebar import Sidebar
 from ui.chat_area import ChatArea
 from ui.settings_panel import SettingsPanel
+from ui.components import start_avatar_prewarm
 
 class MainWindow:
     """Главное окно мессенджера."""
@@ -25,6 +26,9 @@ class MainWindow:
         self.api_manager = APIManager()
         self.chat_manager = ChatManager()
         
+        # Аватарки для списка чатов рисуются в фоне, пока Tk строит окно
+        start_avatar_prewarm((name for _, name, _ in self.chat_manager.ordered_chat_view), AVATAR_SIZE_SMALL)
+        
         # Устанавливаем первого провайдера по умолчанию
         providers = self.api_manager.get_providers()
         if providers:
@@ -32,6 +36,9 @@ class MainWindow:
             if models:
                 self.api_manager.set_provider_and_model(providers[0], models[0])
         
+        # Открытый сейчас чат (или "settings"): повторный клик по нему ничего не делает
+        self._current_chat_id = None
+        
         # Создание GUI
         self.create_gui()
     
@@ -53,17 +60,29 @@ class MainWindow:
         
         # Панель настроек
         self.settings_panel = SettingsPanel(self.right_panel, self.api_manager)
+        
+        # Обе панели лежат друг на друге; переключение - lift() без пересчета геометрии
+        self.chat_area.place(relx=0, rely=0, relwidth=1, relheight=1)
+        self.settings_panel.place(relx=0, rely=0, relwidth=1, relheight=1)
+        # До выбора чата правая панель пустая, как и раньше
+        self._blank_panel = tk.Frame(self.right_panel, bg=COLORS['bg_primary'])
+        self._blank_panel.place(relx=0, rely=0, relwidth=1, relheight=1)
     
     def on_chat_select(self, chat_id):
         """Обработчик выбора чата."""
-        # Скрываем все панели
-        self.chat_area.pack_forget()
-        self.settings_panel.pack_forget()
+        if chat_id == self._current_chat_id:
+            return
+        self._current_chat_id = chat_id
         
         if chat_id == "settings":
             # Показываем настройки
-            self.settings_panel.pack(fill=tk.BOTH, expand=True)
+            self.settings_panel.lift()
         else:
             # Показываем чат
-            self.chat_area.pack(fill=tk.BOTH, expand=True)
+            self.chat_area.lift()
             self.chat_area.open_chat(chat_id)
+    
+    def close(self):
+        """Освобождает ресурсы менеджеров и сохраняет несохраненную историю."""
+        self.api_manager.close()
+        self.chat_manager.close()
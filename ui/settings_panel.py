@@ -6,6 +6,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from config.settings import COLORS
+from ui.styles import get_font
 
 class SettingsPanel(tk.Frame):
     """Панель настроек провайдера и модели."""
@@ -21,52 +22,57 @@ class SettingsPanel(tk.Frame):
     
     def create_widgets(self):
         """Создает виджеты панели настроек."""
+        bg_primary = COLORS['bg_primary']
+        text_primary = COLORS['text_primary']
+        text_secondary = COLORS['text_secondary']
+        accent = COLORS['accent']
+        
         # Заголовок
         title = tk.Label(
             self,
             text="⚙️ Настройки",
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 18, 'bold'),
+            bg=bg_primary,
+            fg=text_primary,
+            font=get_font('title_large'),
             pady=20
         )
         title.pack(anchor='w', padx=20)
         
         # Секция выбора провайдера
-        provider_frame = tk.Frame(self, bg=COLORS['bg_primary'])
+        provider_frame = tk.Frame(self, bg=bg_primary)
         provider_frame.pack(fill=tk.X, padx=20, pady=10)
         
         provider_label = tk.Label(
             provider_frame,
             text="Провайдер:",
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 12, 'bold')
+            bg=bg_primary,
+            fg=text_primary,
+            font=get_font('label_bold')
         )
         provider_label.pack(anchor='w', pady=(0, 5))
         
-        providers = self.api_manager.get_providers()
+        self.providers = self.api_manager.get_providers()
         self.provider_combo = ttk.Combobox(
             provider_frame,
             textvariable=self.provider_var,
-            values=providers,
+            values=self.providers,
             state='readonly',
-            font=('Arial', 11),
+            font=get_font('body'),
             width=40
         )
         self.provider_combo.pack(anchor='w', pady=(0, 10))
         self.provider_combo.bind('<<ComboboxSelected>>', self.on_provider_changed)
         
         # Секция выбора модели
-        model_frame = tk.Frame(self, bg=COLORS['bg_primary'])
+        model_frame = tk.Frame(self, bg=bg_primary)
         model_frame.pack(fill=tk.X, padx=20, pady=10)
         
         model_label = tk.Label(
             model_frame,
             text="Модель:",
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 12, 'bold')
+            bg=bg_primary,
+            fg=text_primary,
+            font=get_font('label_bold')
         )
         model_label.pack(anchor='w', pady=(0, 5))
         
@@ -74,8 +80,9 @@ class SettingsPanel(tk.Frame):
             model_frame,
             textvariable=self.model_var,
             state='readonly',
-            font=('Arial', 11),
-            width=40
+            font=get_font('body'),
+            width=40,
+            postcommand=self._populate_model_values
         )
         self.model_combo.pack(anchor='w', pady=(0, 10))
         
@@ -84,9 +91,9 @@ class SettingsPanel(tk.Frame):
             self,
             text="Выбранные настройки будут применены ко всем чатам.\n"
                  "Настройки провайдера хранятся в config/providers.yml",
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_secondary'],
-            font=('Arial', 9),
+            bg=bg_primary,
+            fg=text_secondary,
+            font=get_font('caption'),
             justify=tk.LEFT,
             wraplength=500
         )
@@ -96,9 +103,9 @@ class SettingsPanel(tk.Frame):
         apply_btn = tk.Button(
             self,
             text="Применить настройки",
-            bg=COLORS['accent'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 12, 'bold'),
+            bg=accent,
+            fg=text_primary,
+            font=get_font('label_bold'),
             relief=tk.FLAT,
             cursor='hand2',
             command=self.apply_settings,
@@ -109,32 +116,36 @@ class SettingsPanel(tk.Frame):
     
     def load_current_settings(self):
         """Загружает текущие настройки."""
-        providers = self.api_manager.get_providers()
+        # Список провайдеров уже получен при создании виджетов
+        providers = self.providers
         if providers:
             current_provider = self.api_manager.current_provider or providers[0]
             self.provider_var.set(current_provider)
-            self.update_models(current_provider)
-            
-            current_model = self.api_manager.current_model
-            if current_model:
-                self.model_var.set(current_model)
+            # Модель по умолчанию подставится при открытии списка или при применении
+            self.model_var.set(self.api_manager.current_model or '')
     
     def on_provider_changed(self, event=None):
         """Обработчик изменения провайдера."""
-        provider = self.provider_var.get()
-        self.update_models(provider)
+        # Модель прежнего провайдера не подходит; список моделей запрашивается только при открытии
+        self.model_var.set('')
     
-    def update_models(self, provider):
-        """Обновляет список моделей для выбранного провайдера."""
-        models = self.api_manager.get_models(provider)
+    def _populate_model_values(self):
+        """Заполняет выпадающий список моделями текущего провайдера перед его открытием."""
+        models = self.api_manager.get_models(self.provider_var.get())
         self.model_combo['values'] = models
-        if models:
+        if models and self.model_var.get() not in models:
             self.model_var.set(models[0])
     
     def apply_settings(self):
         """Применяет выбранные настройки."""
         provider = self.provider_var.get()
         model = self.model_var.get()
+        if provider and not model:
+            # Список моделей не открывали - берем модель провайдера по умолчанию
+            models = self.api_manager.get_models(provider)
+            if models:
+                model = models[0]
+                self.model_var.set(model)
         
         if not provider or not model:
             messagebox.showwarning("Ошибка", "Выберите провайдера и модель")
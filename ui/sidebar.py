@@ -4,9 +4,20 @@
 Боковая панель со списком чатов
 """
 import tkinter as tk
-from tkinter import ttk
-from config.settings import COLORS, SIDEBAR_WIDTH, AVATAR_SIZE_SMALL
-from ui.components import generate_placeholder_avatar
+from tkinter import ttk, messagebox
+from config.settings import COLORS, SIDEBAR_WIDTH, SIDEBAR_ROW_HEIGHT, AVATAR_SIZE_SMALL, AVATAR_HYDRATE_POLL_MS
+from ui.components import generate_placeholder_avatar, get_cached_avatar, avatar_prewarm_running
+from ui.styles import get_font
+
+# Фон строки чата по типу события наведения
+_ROW_BG = {
+    tk.EventType.Enter: COLORS['hover'],
+    tk.EventType.Leave: COLORS['bg_secondary'],
+}
+
+def _on_row_hover(event):
+    """Подсвечивает строку чата под курсором и снимает подсветку при уходе."""
+    event.widget.config(bg=_ROW_BG[event.type])
 
 class Sidebar(tk.Frame):
     """Боковая панель с чатами."""
@@ -16,64 +27,71 @@ class Sidebar(tk.Frame):
         self.chat_manager = chat_manager
         self.on_chat_select = on_chat_select
         self.pack_propagate(False)
+        # Список чатов виртуальный: (id, имя, тип) для всех чатов и пул строк только для видимых
+        self._entries = []
+        self._row_pool = []
+        # Аватарки, которых еще нет в кэше, дорисовываются после первой отрисовки списка
+        self._blank_avatar = None
+        self._hydrate_scheduled = False
+        self._populate_scheduled = False
         
         self.create_widgets()
         self.populate_chats()
     
     def create_widgets(self):
         """Создает виджеты sidebar."""
+        bg_secondary = COLORS['bg_secondary']
+        text_primary = COLORS['text_primary']
+        bg_primary = COLORS['bg_primary']
+        text_secondary = COLORS['text_secondary']
+        accent = COLORS['accent']
+        
         # Заголовок
         header = tk.Label(
             self,
             text="Чаты",
-            bg=COLORS['bg_secondary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 16, 'bold'),
+            bg=bg_secondary,
+            fg=text_primary,
+            font=get_font('title'),
             pady=15
         )
         header.pack(fill=tk.X)
         
         # Поиск (заглушка)
-        search_frame = tk.Frame(self, bg=COLORS['bg_secondary'])
+        search_frame = tk.Frame(self, bg=bg_secondary)
         search_frame.pack(fill=tk.X, padx=10, pady=5)
         
         search_entry = tk.Entry(
             search_frame,
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_secondary'],
-            insertbackground=COLORS['text_primary'],
+            bg=bg_primary,
+            fg=text_secondary,
+            insertbackground=text_primary,
             relief=tk.FLAT,
-            font=('Arial', 10)
+            font=get_font('small')
         )
         search_entry.insert(0, "🔍 Поиск...")
         search_entry.pack(fill=tk.X, ipady=5)
         
         # Контейнер для списка чатов
-        chats_frame = tk.Frame(self, bg=COLORS['bg_secondary'])
+        chats_frame = tk.Frame(self, bg=bg_secondary)
         chats_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        canvas = tk.Canvas(chats_frame, bg=COLORS['bg_secondary'], highlightthickness=0)
-        scrollbar = ttk.Scrollbar(chats_frame, orient="vertical", command=canvas.yview)
-        self.chats_container = tk.Frame(canvas, bg=COLORS['bg_secondary'])
-        
-        self.chats_container.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
+        self.chats_canvas = tk.Canvas(chats_frame, bg=bg_secondary, highlightthickness=0)
+        self.chats_scrollbar = ttk.Scrollbar(chats_frame, orient="vertical", command=self.chats_canvas.yview)
         
-        canvas.create_window((0, 0), window=self.chats_container, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.chats_canvas.bind("<Configure>", self.on_chats_canvas_configure)
+        self.chats_canvas.configure(yscrollcommand=self.on_chats_scroll)
+        self.chats_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.chats_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Кнопка создания группы
         create_group_btn = tk.Button(
             self,
             text="➕ Создать группу",
-            bg=COLORS['accent'],
-            fg=COLORS['text_primary'],
+            bg=accent,
+            fg=text_primary,
             relief=tk.FLAT,
-            font=('Arial', 10, 'bold'),
+            font=get_font('small_bold'),
             pady=10,
             cursor='hand2',
             command=self.create_group_dialog
@@ -81,160 +99,262 @@ class Sidebar(tk.Frame):
         create_group_btn.pack(fill=tk.X, side=tk.BOTTOM, padx=10, pady=10)
     
     def populate_chats(self):
-        """Заполняет список чатов."""
-        for widget in self.chats_container.winfo_children():
-            widget.destroy()
-        
-        # Добавляем настройки
-        self.create_chat_item("settings", "⚙️ Настройки", "system")
-        
-        # Личные чаты
-        for char_id, char in self.chat_manager.characters.items():
-            self.create_chat_item(char_id, char.name, 'private')
-        
-        # Групповые чаты
-        for group_id, group in self.chat_manager.groups.items():
-            self.create_chat_item(group_id, group.name, 'group')
+        """Планирует обновление списка чатов; несколько вызовов за один проход цикла событий схлопываются."""
+        if not self._populate_scheduled:
+            self._populate_scheduled = True
+            self.after_idle(self._populate_chats_now)
     
-    def create_chat_item(self, chat_id, name, chat_type):
-        """Создает элемент чата в списке."""
-        item_frame = tk.Frame(self.chats_container, bg=COLORS['bg_secondary'], cursor='hand2')
-        item_frame.pack(fill=tk.X, pady=2)
-        item_frame.bind('<Button-1>', lambda e: self.on_chat_select(chat_id))
-        
-        content_frame = tk.Frame(item_frame, bg=COLORS['bg_secondary'])
-        content_frame.pack(fill=tk.X, padx=10, pady=8)
-        
-        # Аватарка
-        if chat_type != 'system':
-            avatar = generate_placeholder_avatar(name, AVATAR_SIZE_SMALL)
-            avatar_label = tk.Label(content_frame, image=avatar, bg=COLORS['bg_secondary'])
-            avatar_label.image = avatar
-            avatar_label.pack(side=tk.LEFT, padx=(0, 10))
-        
-        # Текст
-        text_frame = tk.Frame(content_frame, bg=COLORS['bg_secondary'])
-        text_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        name_label = tk.Label(
-            text_frame,
-            text=name,
-            bg=COLORS['bg_secondary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 11, 'bold'),
-            anchor='w'
+    def _populate_chats_now(self):
+        """Заполняет список чатов; виджеты создаются только для видимых строк."""
+        self._populate_scheduled = False
+        entries = [("settings", "⚙️ Настройки", "system")]
+        entries.extend(self.chat_manager.ordered_chat_view)
+        self._entries = entries
+        
+        self.chats_canvas.configure(scrollregion=(0, 0, 0, len(entries) * SIDEBAR_ROW_HEIGHT))
+        self._refresh_visible_rows()
+    
+    def on_chats_scroll(self, first, last):
+        """Обновляет полосу прокрутки и строки, попавшие в видимую область."""
+        self.chats_scrollbar.set(first, last)
+        self._refresh_visible_rows()
+    
+    def on_chats_canvas_configure(self, event):
+        """Подгоняет ширину строк под холст и дорисовывает строки при изменении высоты."""
+        for row in self._row_pool:
+            self.chats_canvas.itemconfigure(row.window_id, width=event.width)
+        self._refresh_visible_rows()
+    
+    def _refresh_visible_rows(self):
+        """Раскладывает строки из пула по видимым позициям списка."""
+        canvas = self.chats_canvas
+        y_top = max(0, int(canvas.canvasy(0)))
+        first = y_top // SIDEBAR_ROW_HEIGHT
+        last = min(len(self._entries), (y_top + canvas.winfo_height()) // SIDEBAR_ROW_HEIGHT + 1)
+        
+        visible = range(first, last)
+        while len(self._row_pool) < len(visible):
+            self._row_pool.append(self.create_chat_item())
+        
+        for row, index in zip(self._row_pool, visible):
+            self._bind_row(row, *self._entries[index])
+            canvas.coords(row.window_id, 0, index * SIDEBAR_ROW_HEIGHT + 2)
+            canvas.itemconfigure(row.window_id, state='normal')
+        for row in self._row_pool[len(visible):]:
+            row.avatar_pending = False
+            canvas.itemconfigure(row.window_id, state='hidden')
+    
+    def _bind_row(self, row, chat_id, name, chat_type):
+        """Показывает в строке из пула данные указанного чата."""
+        row.chat_id = chat_id
+        if row.chat_name != name:
+            row.chat_name = name
+            # Отступ между аватаркой и именем задается пробелами: строка - один Label
+            row.config(text=name if chat_type == 'system' else f"  {name}")
+        if chat_type == 'system':
+            row.avatar_pending = False
+            avatar = ''
+        else:
+            avatar = get_cached_avatar(name, AVATAR_SIZE_SMALL)
+            row.avatar_pending = avatar is None
+            if avatar is None:
+                if self._blank_avatar is None:
+                    self._blank_avatar = tk.PhotoImage(width=AVATAR_SIZE_SMALL, height=AVATAR_SIZE_SMALL)
+                avatar = self._blank_avatar
+                if not self._hydrate_scheduled:
+                    self._hydrate_scheduled = True
+                    self.after_idle(self._hydrate_avatars)
+        if row.image is not avatar:
+            row.config(image=avatar)
+            row.image = avatar
+    
+    def _hydrate_avatars(self):
+        """Рисует аватарки для видимых строк, которые пока показаны с пустой заглушкой."""
+        self._hydrate_scheduled = False
+        prewarming = avatar_prewarm_running()
+        waiting = False
+        for row in self._row_pool:
+            if row.avatar_pending:
+                avatar = get_cached_avatar(row.chat_name, AVATAR_SIZE_SMALL)
+                if avatar is None:
+                    if prewarming:
+                        # Фоновый поток еще рисует: не дублируем его работу в потоке Tk
+                        waiting = True
+                        continue
+                    avatar = generate_placeholder_avatar(row.chat_name, AVATAR_SIZE_SMALL)
+                row.avatar_pending = False
+                row.config(image=avatar)
+                row.image = avatar
+        if waiting:
+            self._hydrate_scheduled = True
+            self.after(AVATAR_HYDRATE_POLL_MS, self._hydrate_avatars)
+    
+    def _on_row_click(self, event):
+        """Открывает чат, показанный в строке."""
+        self.on_chat_select(event.widget.chat_id)
+    
+    def create_chat_item(self):
+        """Создает строку списка чатов для пула; данные чата задает _bind_row."""
+        bg_secondary = COLORS['bg_secondary']
+        text_primary = COLORS['text_primary']
+        
+        # Аватарка и имя - один Label с compound, без вложенных фреймов
+        row = tk.Label(
+            self.chats_canvas,
+            text="",
+            compound=tk.LEFT,
+            anchor='w',
+            bg=bg_secondary,
+            fg=text_primary,
+            font=get_font('body_bold'),
+            padx=10,
+            pady=8,
+            cursor='hand2'
         )
-        name_label.pack(fill=tk.X)
-        
-        # Hover эффект
-        def on_enter(e):
-            item_frame.config(bg=COLORS['hover'])
-            content_frame.config(bg=COLORS['hover'])
-            text_frame.config(bg=COLORS['hover'])
-            name_label.config(bg=COLORS['hover'])
-            if chat_type != 'system':
-                avatar_label.config(bg=COLORS['hover'])
-        
-        def on_leave(e):
-            item_frame.config(bg=COLORS['bg_secondary'])
-            content_frame.config(bg=COLORS['bg_secondary'])
-            text_frame.config(bg=COLORS['bg_secondary'])
-            name_label.config(bg=COLORS['bg_secondary'])
-            if chat_type != 'system':
-                avatar_label.config(bg=COLORS['bg_secondary'])
-        
-        item_frame.bind('<Enter>', on_enter)
-        item_frame.bind('<Leave>', on_leave)
+        row.window_id = self.chats_canvas.create_window(
+            0, 0, window=row, anchor='nw',
+            width=self.chats_canvas.winfo_width(), height=SIDEBAR_ROW_HEIGHT - 4
+        )
+        row.chat_id = None
+        row.chat_name = None
+        row.image = None
+        row.avatar_pending = False
+        
+        # Клик и hover эффект: общие обработчики для всех строк
+        row.bind('<Button-1>', self._on_row_click)
+        row.bind('<Enter>', _on_row_hover)
+        row.bind('<Leave>', _on_row_hover)
+        return row
     
     def create_group_dialog(self):
         """Открывает диалог создания группы."""
-        from tkinter import messagebox, simpledialog
+        bg_primary = COLORS['bg_primary']
+        text_primary = COLORS['text_primary']
+        bg_secondary = COLORS['bg_secondary']
+        accent = COLORS['accent']
         
         dialog = tk.Toplevel(self)
         dialog.title("Создать группу")
         dialog.geometry("400x500")
-        dialog.configure(bg=COLORS['bg_primary'])
+        dialog.configure(bg=bg_primary)
         dialog.transient(self)
         dialog.grab_set()
         
         title_label = tk.Label(
             dialog,
             text="Создание группы",
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 16, 'bold'),
+            bg=bg_primary,
+            fg=text_primary,
+            font=get_font('title'),
             pady=15
         )
         title_label.pack()
         
-        name_frame = tk.Frame(dialog, bg=COLORS['bg_primary'])
+        name_frame = tk.Frame(dialog, bg=bg_primary)
         name_frame.pack(fill=tk.X, padx=20, pady=10)
         
         name_label = tk.Label(
             name_frame,
             text="Название группы:",
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 11)
+            bg=bg_primary,
+            fg=text_primary,
+            font=get_font('body')
         )
         name_label.pack(anchor='w')
         
         name_entry = tk.Entry(
             name_frame,
-            bg=COLORS['bg_secondary'],
-            fg=COLORS['text_primary'],
-            insertbackground=COLORS['text_primary'],
+            bg=bg_secondary,
+            fg=text_primary,
+            insertbackground=text_primary,
             relief=tk.FLAT,
-            font=('Arial', 11)
+            font=get_font('body')
         )
         name_entry.pack(fill=tk.X, ipady=5)
         
         members_label = tk.Label(
             dialog,
             text="Выберите участников:",
-            bg=COLORS['bg_primary'],
-            fg=COLORS['text_primary'],
-            font=('Arial', 11),
+            bg=bg_primary,
+            fg=text_primary,
+            font=get_font('body'),
             pady=10
         )
         members_label.pack(anchor='w', padx=20)
         
-        members_frame = tk.Frame(dialog, bg=COLORS['bg_primary'])
-        members_frame.pack(fill=tk.BOTH, expand=True, padx=20)
+        # Поиск по участникам
+        search_var = tk.StringVar()
+        search_entry = tk.Entry(
+            dialog,
+            textvariable=search_var,
+            bg=bg_secondary,
+            fg=text_primary,
+            insertbackground=text_primary,
+            relief=tk.FLAT,
+            font=get_font('body')
+        )
+        search_entry.pack(fill=tk.X, padx=20, pady=(0, 10), ipady=5)
         
-        canvas = tk.Canvas(members_frame, bg=COLORS['bg_primary'], highlightthickness=0)
-        scrollbar = ttk.Scrollbar(members_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas, bg=COLORS['bg_primary'])
+        members_frame = tk.Frame(dialog, bg=bg_primary)
+        members_frame.pack(fill=tk.BOTH, expand=True, padx=20)
         
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
+        # Treeview рисует только видимые строки, поэтому список не зависит от числа персонажей
+        style = ttk.Style(dialog)
+        style.configure(
+            'Members.Treeview',
+            background=bg_secondary,
+            fieldbackground=bg_secondary,
+            foreground=text_primary,
+            font=get_font('body'),
+            rowheight=30,
+            borderwidth=0
         )
-        
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        tree = ttk.Treeview(members_frame, show='tree', selectmode='none', style='Members.Treeview')
+        scrollbar = ttk.Scrollbar(members_frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        checkboxes = {}
-        for char_id, char in self.chat_manager.characters.items():
-            var = tk.BooleanVar()
-            cb = tk.Checkbutton(
-                scrollable_frame,
-                text=char.name,
-                variable=var,
-                bg=COLORS['bg_primary'],
-                fg=COLORS['text_primary'],
-                selectcolor=COLORS['bg_secondary'],
-                activebackground=COLORS['bg_primary'],
-                activeforeground=COLORS['text_primary'],
-                font=('Arial', 11),
-                cursor='hand2'
-            )
-            cb.pack(anchor='w', pady=5)
-            checkboxes[char_id] = var
-        
-        buttons_frame = tk.Frame(dialog, bg=COLORS['bg_primary'])
+        characters = [(char_id, char.name, char.name.lower()) for char_id, char in self.chat_manager.characters.items()]
+        checked = set()
+        for char_id, char_name, _ in characters:
+            tree.insert('', 'end', iid=char_id, text=f"☐ {char_name}")
+        
+        def toggle_member(event):
+            char_id = tree.identify_row(event.y)
+            if not char_id:
+                return
+            if char_id in checked:
+                checked.discard(char_id)
+                mark = '☐'
+            else:
+                checked.add(char_id)
+                mark = '☑'
+            tree.item(char_id, text=f"{mark} {self.chat_manager.characters[char_id].name}")
+        
+        def filter_members(*args):
+            query = search_var.get().strip().lower()
+            index = 0
+            for char_id, _, name_lower in characters:
+                if query in name_lower:
+                    tree.move(char_id, '', index)
+                    index += 1
+                else:
+                    tree.detach(char_id)
+        
+        tree.bind('<Button-1>', toggle_member)
+        trace_name = search_var.trace_add('write', filter_members)
+        
+        def close_dialog():
+            # Трассировка живет в Tcl и держит замыкание вместе с диалогом - снимаем ее явно
+            search_var.trace_remove('write', trace_name)
+            checked.clear()
+            tree.delete(*tree.get_children(''))
+            dialog.destroy()
+        
+        dialog.protocol("WM_DELETE_WINDOW", close_dialog)
+        
+        buttons_frame = tk.Frame(dialog, bg=bg_primary)
         buttons_frame.pack(fill=tk.X, padx=20, pady=20)
         
         def create_group():
@@ -243,13 +363,14 @@ class Sidebar(tk.Frame):
                 messagebox.showwarning("Ошибка", "Введите название группы")
                 return
             
-            selected = [char_id for char_id, var in checkboxes.items() if var.get()]
+            # Порядок участников - как в списке персонажей
+            selected = [char_id for char_id, _, _ in characters if char_id in checked]
             if len(selected) < 2:
                 messagebox.showwarning("Ошибка", "Выберите минимум 2 участников")
                 return
             
             group_id = self.chat_manager.create_group(group_name, selected)
-            dialog.destroy()
+            close_dialog()
             self.populate_chats()
             self.on_chat_select(group_id)
             messagebox.showinfo("Успех", f"Группа '{group_name}' создана!")
@@ -257,10 +378,10 @@ class Sidebar(tk.Frame):
         create_btn = tk.Button(
             buttons_frame,
             text="Создать",
-            bg=COLORS['accent'],
-            fg=COLORS['text_primary'],
+            bg=accent,
+            fg=text_primary,
             relief=tk.FLAT,
-            font=('Arial', 11, 'bold'),
+            font=get_font('body_bold'),
             cursor='hand2',
             command=create_group
         )
@@ -269,11 +390,11 @@ class Sidebar(tk.Frame):
         cancel_btn = tk.Button(
             buttons_frame,
             text="Отмена",
-            bg=COLORS['bg_secondary'],
-            fg=COLORS['text_primary'],
+            bg=bg_secondary,
+            fg=text_primary,
             relief=tk.FLAT,
-            font=('Arial', 11),
+            font=get_font('body'),
             cursor='hand2',
-            command=dialog.destroy
+            command=close_dialog
         )
         cancel_btn.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=(5, 0))
@@ -0,0 +1,33 @@
+# ui/styles.py
+# -*- coding: utf-8 -*-
+"""
+Общие именованные шрифты интерфейса
+"""
+import tkinter.font as tkfont
+
+# Шрифты интерфейса: имя -> (семейство, размер, начертание)
+_FONT_SPECS = {
+    'title_large': ('Arial', 18, 'bold'),
+    'title': ('Arial', 16, 'bold'),
+    'icon': ('Arial', 16, 'normal'),
+    'header': ('Arial', 14, 'bold'),
+    'label_bold': ('Arial', 12, 'bold'),
+    'body_bold': ('Arial', 11, 'bold'),
+    'body': ('Arial', 11, 'normal'),
+    'small_bold': ('Arial', 10, 'bold'),
+    'small': ('Arial', 10, 'normal'),
+    'caption_bold': ('Arial', 9, 'bold'),
+    'caption': ('Arial', 9, 'normal'),
+    'tiny': ('Arial', 8, 'normal'),
+}
+
+# Созданные шрифты; Tk измеряет именованный шрифт один раз, а не для каждого виджета
+_FONTS = {}
+
+def get_font(name: str) -> tkfont.Font:
+    """Возвращает именованный шрифт, создавая его при первом обращении (нужен созданный Tk)."""
+    font = _FONTS.get(name)
+    if font is None:
+        family, size, weight = _FONT_SPECS[name]
+        font = _FONTS[name] = tkfont.Font(family=family, size=size, weight=weight)
+    return font